@@ -0,0 +1,237 @@
+import hashlib
+import logging
+import mimetypes
+import os
+import struct
+
+from datetime import timedelta
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+ID3V2_HEADER_SIZE = 10
+ID3V1_SIZE = 128
+
+# MPEG audio header lookup tables, indexed by [version][layer] / [version]
+# version: 3 = MPEG1, 2 = MPEG2, 0 = MPEG2.5 ; layer: 3 = I, 2 = II, 1 = III
+BITRATES_KBPS = {
+  (3, 3): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+  (3, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+  (3, 1): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+  (2, 3): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+  (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+  (2, 1): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def _syncsafe(size):
+  '''Encodes size as a 4 byte ID3v2.4 syncsafe integer'''
+  return bytes([(size >> 21) & 0x7f, (size >> 14) & 0x7f, (size >> 7) & 0x7f, size & 0x7f])
+
+
+def _unsyncsafe(data):
+  return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _id3_frame(frame_id, payload):
+  return frame_id.encode('ascii') + _syncsafe(len(payload)) + b'\x00\x00' + payload
+
+
+def build_id3_tag(title=None, episode_number=None, artwork=None):
+  '''Builds an ID3v2.4 tag with the given title, episode (track) number and
+  artwork (path to a jpg/png file). Returns the tag as bytes.
+  '''
+  frames = []
+  if title:
+    frames.append(_id3_frame('TIT2', b'\x03' + title.encode('utf-8')))
+  if episode_number:
+    frames.append(_id3_frame('TRCK', b'\x03' + str(episode_number).encode('utf-8')))
+  if artwork:
+    mime_type = mimetypes.guess_type(artwork)[0] or 'image/jpeg'
+    with open(artwork, "rb") as f:
+      image = f.read()
+    # text encoding, mime type, picture type 3 (front cover), empty description, image data
+    frames.append(_id3_frame('APIC', b'\x03' + mime_type.encode('ascii') + b'\x00\x03\x00' + image))
+  body = b''.join(frames)
+  return b'ID3\x04\x00\x00' + _syncsafe(len(body)) + body
+
+
+def id3v2_size(header):
+  '''Returns the full size of the ID3v2 tag starting at header, or 0 if there is none'''
+  if len(header) < ID3V2_HEADER_SIZE or header[:3] != b'ID3':
+    return 0
+  footer = ID3V2_HEADER_SIZE if header[5] & 0x10 else 0
+  return ID3V2_HEADER_SIZE + _unsyncsafe(header[6:10]) + footer
+
+
+def parse_mpeg_info(data):
+  '''Finds the first MPEG audio frame in data and reads its header along with
+  any Xing/Info/VBRI header it carries.
+     Returns:
+       - dictionary containing offset, bitrate (bits/s), sample_rate,
+         samples_per_frame and frames (None for CBR files without a Xing header)
+       - None if no valid frame header was found
+  '''
+  offset = data.find(b'\xff')
+  while 0 <= offset <= len(data) - 4:
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    version, layer = (b1 >> 3) & 3, (b1 >> 1) & 3
+    bitrate_index, sample_rate_index = b2 >> 4, (b2 >> 2) & 3
+    if (b1 & 0xe0) == 0xe0 and version != 1 and layer != 0 and bitrate_index not in (0, 15) \
+      and sample_rate_index != 3:
+      mono = (b3 >> 6) == 3
+      if layer == 3:
+        samples_per_frame = 384
+      elif layer == 2 or version == 3:
+        samples_per_frame = 1152
+      else:
+        samples_per_frame = 576
+      info = {
+        'offset': offset,
+        'bitrate': BITRATES_KBPS[(3 if version == 3 else 2, layer)][bitrate_index] * 1000,
+        'sample_rate': SAMPLE_RATES[version][sample_rate_index],
+        'samples_per_frame': samples_per_frame,
+        'frames': None
+      }
+      if version == 3:
+        xing_offset = offset + (21 if mono else 36)
+      else:
+        xing_offset = offset + (13 if mono else 21)
+      if data[xing_offset:xing_offset + 4] in (b'Xing', b'Info'):
+        flags = struct.unpack('>I', data[xing_offset + 4:xing_offset + 8])[0]
+        if flags & 1:
+          info['frames'] = struct.unpack('>I', data[xing_offset + 8:xing_offset + 12])[0]
+      elif data[offset + 36:offset + 40] == b'VBRI':
+        info['frames'] = struct.unpack('>I', data[offset + 50:offset + 54])[0]
+      return info
+    offset = data.find(b'\xff', offset + 1)
+  return None
+
+
+class AudioIngest(object):
+  '''Reads an mp3 in a single pass, computing its duration, size, sha256 and
+  md5 from the same chunks that are handed on to the s3 upload. When tags are
+  given, any existing ID3v2 tag is replaced by a freshly built one in the
+  uploaded stream (the local file is left untouched).
+
+  Usage:
+    with AudioIngest(path, tags={'title': ..., 'episode_number': ..., 'artwork': ...}) as ingest:
+      upload(ingest.chunks(), ingest.size)
+      meta = ingest.metadata()
+  '''
+
+  def __init__(self, path, chunk_size=DEFAULT_CHUNK_SIZE, tags=None):
+    self.path = path
+    self.chunk_size = chunk_size
+    self._file = open(path, "rb")
+    self._file_size = os.fstat(self._file.fileno()).st_size
+    self._first_chunk = self._file.read(chunk_size)
+    self._original_tag_size = id3v2_size(self._first_chunk)
+    self._new_tag = build_id3_tag(**tags) if tags else None
+    self._mpeg_info = None
+    self._tail = b''
+    self._sha256 = None
+    self._md5 = None
+    self._complete = False
+
+  @property
+  def size(self):
+    '''Size in bytes of the stream produced by chunks()'''
+    if self._new_tag is None:
+      return self._file_size
+    return self._file_size - self._original_tag_size + len(self._new_tag)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  def close(self):
+    self._file.close()
+
+  def _read_source(self):
+    '''Yields the file contents, starting with the chunk read at construction.
+    Any later call has to go back to disk.
+    '''
+    if self._first_chunk is not None:
+      first_chunk, self._first_chunk = self._first_chunk, None
+      yield first_chunk
+    else:
+      self._file.seek(0)
+    yield from iter(lambda: self._file.read(self.chunk_size), b'')
+
+  def chunks(self):
+    '''Yields the audio to upload, hashing it and reading the MPEG header on the way'''
+    self._sha256, self._md5 = hashlib.sha256(), hashlib.md5()
+    self._complete = False
+    header_buffer = b''
+    skip = self._original_tag_size if self._new_tag is not None else 0
+    position = 0
+
+    if self._new_tag is not None:
+      self._sha256.update(self._new_tag)
+      self._md5.update(self._new_tag)
+      yield self._new_tag
+
+    for chunk in self._read_source():
+      # work out the duration from the first frame after the original ID3v2 tag
+      if self._mpeg_info is None and position + len(chunk) > self._original_tag_size:
+        header_buffer += chunk[max(0, self._original_tag_size - position):]
+        if len(header_buffer) >= 4096:
+          self._mpeg_info = parse_mpeg_info(header_buffer[:64 * 1024]) or {}
+          header_buffer = b''
+      self._tail = (self._tail + chunk)[-ID3V1_SIZE:]
+      position += len(chunk)
+
+      if skip:
+        dropped = min(skip, len(chunk))
+        chunk, skip = chunk[dropped:], skip - dropped
+        if not chunk:
+          continue
+      self._sha256.update(chunk)
+      self._md5.update(chunk)
+      yield chunk
+
+    if self._mpeg_info is None:
+      self._mpeg_info = parse_mpeg_info(header_buffer) or {}
+    self._complete = True
+
+  def consume(self):
+    '''Reads through the whole stream without uploading it. Returns metadata()'''
+    for _ in self.chunks():
+      pass
+    return self.metadata()
+
+  def _duration_seconds(self):
+    info = self._mpeg_info
+    if info and info['frames']:
+      return info['frames'] * info['samples_per_frame'] / info['sample_rate']
+    if info and info['bitrate']:
+      audio_bytes = self._file_size - self._original_tag_size - info['offset']
+      if self._tail[:3] == b'TAG':
+        audio_bytes -= ID3V1_SIZE
+      return audio_bytes * 8 / info['bitrate']
+
+    # header could not be read, let mutagen have a go at it
+    logger.warning(f"Could not find an MPEG frame header in {self.path}, falling back to mutagen")
+    from mutagen.mp3 import MP3
+    return MP3(self.path).info.length
+
+  def metadata(self):
+    '''Returns:
+         - dictionary containing:
+           - duration: duration of episode (in hours/minutes/seconds)
+           - size: size of the uploaded audio (in bytes)
+           - sha256: hex sha256 of the uploaded audio
+           - md5: hex md5 of the uploaded audio
+    '''
+    if not self._complete:
+      raise RuntimeError("metadata() is only available once chunks() has been fully consumed")
+    return {
+      'duration': str(timedelta(seconds=int(self._duration_seconds()))),
+      'size': self.size,
+      'sha256': self._sha256.hexdigest(),
+      'md5': self._md5.hexdigest()
+    }
@@ -0,0 +1,234 @@
+'''Offline benchmarks of the hot paths of upload_podcast.py.
+
+Runs rss_update_for_new_episode, create_episode_html_page,
+update_website_index_page and bulk_index_update against synthetic catalogues,
+with s3 and the platforms replaced by the stand-ins in stand_ins.py, and
+reports wall time, throughput and peak memory (tracemalloc) of each.
+
+Usage (from the podcast_workflow folder):
+    python benchmarks/run_benchmarks.py [--sizes 50 500 5000] [--repeat 3]
+        [--output results.json] [--baseline results.json]
+'''
+import argparse
+import builtins
+import contextlib
+import io
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from benchmarks import stand_ins
+
+DEFAULT_SIZES = (50, 500, 5000)
+BENCHMARKS = ('rss_update_for_new_episode', 'create_episode_html_page', 'update_website_index_page',
+  'bulk_index_update', 'bulk_index_update_delta', 'shorten_urls')
+
+
+def write_config(work_dir):
+  '''Writes the config.ini the workflow reads at import time, pointing every local file at work_dir'''
+  config = {
+    'EPISODES_BUCKET_NAME': 'bench-episodes',
+    'WEBSITE_BUCKET_NAME': 'bench-website',
+    'HTML_TEMPLATE_LOCAL_FILENAME': os.path.join(stand_ins.FIXTURES_DIR, "episode_template.html"),
+    'INDEX_HTML_REMOTE_FILENAME': 'index.html',
+    'RSS_REMOTE_FILENAME': 'podcast.xml',
+    'APPLE_PODCAST_URL': stand_ins.APPLE_PODCAST_URL,
+    'DEVICE_ID': 'benchmark',
+    'SPOTIFY_SHOW_ID': stand_ins.SHOW_ID,
+    'SPOTIFY_CACHE_FILEPATH': os.path.join(work_dir, "spotify_episodes_cache.json"),
+    'CATALOG_FILEPATH': os.path.join(work_dir, "episode_catalog.db"),
+    'SHORTENER_PROVIDER': 'stub',
+    'SHORTENER_CACHE_FILEPATH': os.path.join(work_dir, "shortened_urls.json"),
+    'METRICS_REPORT_FILEPATH': os.path.join(work_dir, "run_metrics.json"),
+    'TWITTER_HANDLE': 'benchmark'
+  }
+  with open(os.path.join(work_dir, "config.ini"), "w") as f:
+    f.write("[DEFAULT]\n")
+    for key, value in config.items():
+      f.write(f"{key} = {value}\n")
+
+
+def import_workflow(work_dir):
+  '''Imports upload_podcast with work_dir/config.ini as its config'''
+  write_config(work_dir)
+  cwd = os.getcwd()
+  os.chdir(work_dir)
+  try:
+    import upload_podcast
+  finally:
+    os.chdir(cwd)
+  return upload_podcast
+
+
+class Environment(object):
+  '''The workflow wired to fresh stand-ins holding a catalogue of size episodes'''
+
+  def __init__(self, workflow, work_dir, size):
+    from metrics_utils.instrumentation import RunMetrics
+    from platform_utils import http_session
+
+    self.workflow = workflow
+    self.work_dir = work_dir
+    self.episodes = stand_ins.synthetic_episodes(size)
+    self.s3 = stand_ins.FakeS3()
+    self.apple = stand_ins.FakeApple(self.episodes)
+    for path in ("spotify_episodes_cache.json", "episode_catalog.db", "shortened_urls.json"):
+      if os.path.exists(os.path.join(work_dir, path)):
+        os.remove(os.path.join(work_dir, path))
+
+    workflow.clients.reset()
+    workflow.clients.set('s3', self.s3)
+    workflow.clients.set('spotify', stand_ins.FakeSpotify(self.episodes))
+    workflow.clients.set('google', stand_ins.FakeMobileclient(self.episodes))
+    workflow.get_storage.cache_clear()
+    workflow.get_url_shortener.cache_clear()
+    workflow.metrics = RunMetrics("benchmark")
+    http_session.get = self.apple.get
+
+    self.s3.put_object(Bucket=workflow.episodes_bucket_name, Key=workflow.rss_remote_file_name,
+      Body=stand_ins.rss_feed(self.episodes))
+    self.s3.put_object(Bucket=workflow.website_bucket_name, Key=workflow.index_html_remote_file_name,
+      Body=stand_ins.index_html(self.episodes))
+
+  def next_episode_meta(self):
+    number = len(self.episodes) + 1
+    return {
+      'name': f"Episode {number}: Matchweek {number} Review",
+      'description': stand_ins.DESCRIPTION,
+      'spotify_url': f"https://open.spotify.com/episode/new{number}",
+      'google_podcast_url': f"https://play.google.com/music/m/Dnew{number}",
+      'apple_podcast_url': f"{stand_ins.APPLE_PODCAST_URL}?i={2000000000 + number}",
+      'file_name': f"episode{number}.html",
+      'release_date': '2030-01-01',
+      'episode_number': str(number),
+      'twitter_status_url': f"https://twitter.com/benchmark/status/{number}"
+    }
+
+  def next_audio_meta(self):
+    number = len(self.episodes) + 1
+    return {'duration': '01:00:00', 'size': '52428800', 'audio_url': f"https://bench-episodes.s3.amazonaws.com/episodes/episode{number}.mp3",
+      's3_obj_name': f"episode{number}.mp3", 'title': f"Episode {number}: Matchweek {number} Review"}
+
+  def reset_catalog(self):
+    path = os.path.join(self.work_dir, "episode_catalog.db")
+    if os.path.exists(path):
+      os.remove(path)
+    spotify_cache = os.path.join(self.work_dir, "spotify_episodes_cache.json")
+    if os.path.exists(spotify_cache):
+      os.remove(spotify_cache)
+
+
+def benchmark_calls(env, name):
+  '''Returns (setup, call, items) for a benchmark. setup runs untimed before every call.
+  items is the number of episodes each call processes, used for the throughput.
+  '''
+  workflow = env.workflow
+  size = len(env.episodes)
+  nothing = lambda: None
+  if name == 'rss_update_for_new_episode':
+    return nothing, lambda: workflow.rss_update_for_new_episode(env.next_audio_meta()), size
+  if name == 'create_episode_html_page':
+    # compiling the template happens once per run, so it is left out of the timings
+    workflow.create_episode_html_page(env.next_episode_meta())
+    return nothing, lambda: workflow.create_episode_html_page(env.next_episode_meta()), 1
+  if name == 'update_website_index_page':
+    # the first update builds the index manifest by parsing index.html, later ones start from the manifest
+    workflow.update_website_index_page(env.next_episode_meta())
+    return nothing, lambda: workflow.update_website_index_page(env.next_episode_meta()), size
+  if name == 'bulk_index_update':
+    return env.reset_catalog, lambda: workflow.bulk_index_update(full=True), size
+  if name == 'bulk_index_update_delta':
+    env.reset_catalog()
+    workflow.bulk_index_update()
+    return nothing, lambda: workflow.bulk_index_update(offline=True), size
+  if name == 'shorten_urls':
+    from twitter_utils.shorten_urls import URLCache
+
+    urls = [f"https://open.spotify.com/episode/{episode['id']}" for episode in env.episodes]
+    shortener = workflow.get_url_shortener()
+
+    def empty_cache():
+      shortener.cache = URLCache()
+    return empty_cache, lambda: shortener.ShortenMany(urls), size
+  raise ValueError(f"Unknown benchmark {name}")
+
+
+def measure(setup, call, items, repeat):
+  '''Times repeat calls, then makes one more under tracemalloc for the peak memory'''
+  timings = []
+  with contextlib.redirect_stdout(io.StringIO()):
+    for _ in range(repeat):
+      setup()
+      started = time.perf_counter()
+      call()
+      timings.append(time.perf_counter() - started)
+    setup()
+    tracemalloc.start()
+    call()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+  median = statistics.median(timings)
+  return {'seconds': median, 'min_seconds': min(timings), 'episodes_per_second': items / median if median else None,
+    'peak_memory_bytes': peak}
+
+
+def run(sizes, repeat, names):
+  work_dir = tempfile.mkdtemp(prefix="podcast_benchmarks_")
+  builtins.input = lambda prompt='': "Benchmark description of the new episode"
+  try:
+    workflow = import_workflow(work_dir)
+    results = {}
+    for size in sizes:
+      for name in names:
+        env = Environment(workflow, work_dir, size)
+        with contextlib.redirect_stdout(io.StringIO()):
+          setup, call, items = benchmark_calls(env, name)
+        result = measure(setup, call, items, repeat)
+        result['s3_calls'] = env.s3.calls
+        results[f"{name}[{size}]"] = result
+        print(format_result(f"{name}[{size}]", result), flush=True)
+    return results
+  finally:
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def format_result(key, result, baseline=None):
+  line = f"{key:<40} {result['seconds'] * 1000:>10.1f} ms {result['episodes_per_second'] or 0:>12.0f} eps/s " \
+    f"{result['peak_memory_bytes'] / 1024 / 1024:>8.1f} MiB peak"
+  if baseline and key in baseline:
+    line += f"  {result['seconds'] / baseline[key]['seconds']:>6.2f}x baseline time"
+  return line
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Offline benchmarks of the podcast workflow")
+  parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help="catalogue sizes to run")
+  parser.add_argument('--repeat', type=int, default=3, help="timed calls per benchmark, the median is reported")
+  parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS), help="benchmarks to run")
+  parser.add_argument('--output', help="json file to write the results to")
+  parser.add_argument('--baseline', help="json results of an earlier run to compare with")
+  args = parser.parse_args(argv)
+
+  results = run(args.sizes, args.repeat, args.only)
+  if args.baseline:
+    with open(args.baseline) as f:
+      baseline = json.load(f)['results']
+    print("\nCompared with", args.baseline)
+    for key, result in results.items():
+      print(format_result(key, result, baseline))
+  if args.output:
+    with open(args.output, "w") as f:
+      json.dump({'python': sys.version, 'sizes': args.sizes, 'repeat': args.repeat, 'results': results}, f, indent=1)
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,232 @@
+'''Local stand-ins for s3, Spotify, Google Play Music, Apple Podcasts and
+the URL shortener, along with a synthetic episode catalogue to feed them.
+Nothing here touches the network.
+'''
+import hashlib
+import html
+import io
+import json
+import os
+
+from datetime import datetime
+from datetime import timedelta
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "fixtures")
+SERIES_TITLE = "Fourth Official Soccer Podcast"
+SHOW_ID = "benchmarkshow"
+APPLE_PODCAST_URL = "https://podcasts.apple.com/us/podcast/fourth-official-soccer-podcast/id1234567890"
+FIRST_RELEASE = datetime(2019, 1, 6, 9, 0)
+DESCRIPTION = ("This week we go over the weekend's results, the transfer rumours that refuse to go away "
+  "and the usual arguments about VAR. ") * 3
+
+
+def synthetic_episodes(count):
+  '''Returns count episodes, oldest first, shaped like the platform data the workflow works with'''
+  episodes = []
+  for number in range(1, count + 1):
+    released = FIRST_RELEASE + timedelta(days=7 * (number - 1))
+    episodes.append({
+      'number': number,
+      'name': f"Episode {number}: Matchweek {number} Review",
+      'description': f"{DESCRIPTION}(episode {number})",
+      'release_date': released.strftime('%Y-%m-%d'),
+      'pub_date': released.strftime('%a, %d %b %Y %H:%M:%S EST'),
+      'timestamp_millis': str(int(released.timestamp() * 1000)),
+      'audio_url': f"https://bench-episodes.s3.amazonaws.com/episodes/episode{number}.mp3",
+      'id': hashlib.sha1(str(number).encode('ascii')).hexdigest()[:22]
+    })
+  return episodes
+
+
+class NotModified(Exception):
+  '''Mimics the botocore ClientError s3 raises for a conditional GET that matched'''
+
+  def __init__(self):
+    super().__init__("Not Modified")
+    self.response = {'Error': {'Code': '304', 'Message': 'Not Modified'}}
+
+
+class NoSuchKey(Exception):
+  pass
+
+
+class _Events(object):
+  def register(self, event_name, handler):
+    self.handler = handler
+
+
+class _Meta(object):
+  def __init__(self):
+    self.events = _Events()
+
+
+class _Paginator(object):
+  def __init__(self, s3):
+    self.s3 = s3
+
+  def paginate(self, Bucket, Prefix=''):
+    keys = sorted(key for bucket, key in self.s3.objects if bucket == Bucket and key.startswith(Prefix))
+    for start in range(0, max(len(keys), 1), 1000):
+      yield {'Contents': [{'Key': key, 'ETag': self.s3.etags[(Bucket, key)], 'Size': len(self.s3.objects[(Bucket, key)])} \
+        for key in keys[start:start + 1000]]}
+
+
+class FakeS3(object):
+  '''In-memory s3 client covering the calls the workflow makes for the rss
+  feed and the website: put_object, get_object (with If-None-Match) and the
+  list_objects_v2 paginator.
+  '''
+
+  class exceptions(object):
+    NoSuchKey = NoSuchKey
+
+  def __init__(self):
+    self.objects = {}
+    self.etags = {}
+    self.calls = 0
+    self.bytes_in = 0
+    self.bytes_out = 0
+    self.meta = _Meta()
+
+  def put_object(self, Bucket, Key, Body, **kwargs):
+    self.calls += 1
+    self.objects[(Bucket, Key)] = Body
+    self.etags[(Bucket, Key)] = f'"{hashlib.md5(Body).hexdigest()}"'
+    self.bytes_in += len(Body)
+    return {'ETag': self.etags[(Bucket, Key)]}
+
+  def get_object(self, Bucket, Key, IfNoneMatch=None, **kwargs):
+    self.calls += 1
+    if (Bucket, Key) not in self.objects:
+      raise NoSuchKey(Key)
+    if IfNoneMatch == self.etags[(Bucket, Key)]:
+      raise NotModified()
+    body = self.objects[(Bucket, Key)]
+    self.bytes_out += len(body)
+    return {'Body': io.BytesIO(body), 'ETag': self.etags[(Bucket, Key)]}
+
+  def get_paginator(self, operation_name):
+    self.calls += 1
+    return _Paginator(self)
+
+
+class FakeSpotify(object):
+  '''spotipy.Spotify stand-in serving recorded pages of the show's episodes, newest first'''
+
+  def __init__(self, episodes):
+    self.items = [{
+      'id': episode['id'],
+      'name': episode['name'],
+      'description': episode['description'],
+      'release_date': episode['release_date'],
+      'external_urls': {'spotify': f"https://open.spotify.com/episode/{episode['id']}"},
+      'duration_ms': 3600000,
+      'language': 'en'
+    } for episode in reversed(episodes)]
+    self.calls = 0
+
+  def search(self, q, limit=10, type='track', market=None):
+    self.calls += 1
+    return {'shows': {'items': [{'id': SHOW_ID, 'name': SERIES_TITLE}]}}
+
+  def show_episodes(self, show_id, limit=50, offset=0, market=None):
+    self.calls += 1
+    page = self.items[offset:offset + limit]
+    has_next = offset + limit < len(self.items)
+    return {'items': page, 'offset': offset, 'limit': limit, 'total': len(self.items),
+      'next': f"https://api.spotify.com/v1/shows/{show_id}/episodes?offset={offset + limit}" if has_next else None}
+
+
+class FakeMobileclient(object):
+  '''gmusicapi Mobileclient stand-in'''
+
+  def __init__(self, episodes):
+    self.podcast_episodes = [{
+      'episodeId': f"D{episode['id']}",
+      'title': episode['name'],
+      'description': episode['description'],
+      'publicationTimestampMillis': episode['timestamp_millis'],
+      'seriesTitle': SERIES_TITLE
+    } for episode in episodes]
+    self.calls = 0
+
+  def get_all_podcast_episodes(self, device_id):
+    self.calls += 1
+    return list(self.podcast_episodes)
+
+
+class FakeResponse(object):
+  def __init__(self, text):
+    self.text = text
+    self.content = text.encode('utf-8')
+    self.status_code = 200
+
+  def json(self):
+    return json.loads(self.text)
+
+  def raise_for_status(self):
+    pass
+
+
+def apple_podcast_page(episodes):
+  '''Returns an Apple Podcasts show page with the shoebox json Apple embeds in it'''
+  shoebox = {
+    'data': {'id': '1234567890', 'type': 'media/podcast', 'attributes': {
+      'name': SERIES_TITLE, 'trackCount': len(episodes), 'url': APPLE_PODCAST_URL}},
+    'included': [{'id': str(1000000000 + episode['number']), 'type': 'media/podcast-episode', 'attributes': {
+      'name': episode['name'],
+      'description': {'standard': episode['description']},
+      'releaseDateTime': f"{episode['release_date']}T09:00:00Z",
+      'url': f"{APPLE_PODCAST_URL}?i={1000000000 + episode['number']}"}} for episode in episodes]
+  }
+  return ('<!DOCTYPE html><html><head><title>Fourth Official Soccer Podcast on Apple Podcasts</title>'
+    '<script type="text/javascript">window.appConfig = {};</script></head><body>'
+    + '<div class="product-header"></div>' * 50
+    + f'<script type="fastboot/shoebox" id="shoebox-ember-data-store">{json.dumps(shoebox)}</script>'
+    + '</body></html>')
+
+
+class FakeApple(object):
+  '''Answers the GETs made for the Apple podcast page and the iTunes lookup endpoint'''
+
+  def __init__(self, episodes):
+    self.page = apple_podcast_page(episodes)
+    self.lookup = json.dumps({'results': [{
+      'wrapperType': 'podcastEpisode',
+      'trackName': episode['name'],
+      'description': episode['description'],
+      'releaseDate': f"{episode['release_date']}T09:00:00Z",
+      'trackViewUrl': f"{APPLE_PODCAST_URL}?i={1000000000 + episode['number']}&uo=4"
+    } for episode in episodes[-200:]]})
+    self.calls = 0
+
+  def get(self, url, params=None, **kwargs):
+    self.calls += 1
+    return FakeResponse(self.lookup if params else self.page)
+
+
+def rss_feed(episodes):
+  '''Returns the rss feed (bytes) listing episodes'''
+  items = ''.join(
+    f"<item><title>{html.escape(episode['name'])}</title><link>{episode['audio_url']}</link>"
+    f"<pubDate>{episode['pub_date']}</pubDate><description>{html.escape(episode['description'])}</description>"
+    f"<enclosure url=\"{episode['audio_url']}\" length=\"52428800\" type=\"audio/mpeg\"/>"
+    f"<guid>{episode['audio_url']}</guid><itunes:duration>01:00:00</itunes:duration>"
+    f"<itunes:summary>{html.escape(episode['description'])}</itunes:summary></item>\n" for episode in episodes)
+  return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<rss version="2.0" xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd"><channel>\n'
+    f'<title>{SERIES_TITLE}</title><link>https://www.fourthofficialsoccerpodcast.com</link>\n'
+    f'{items}</channel></rss>\n').encode('utf-8')
+
+
+def index_html(episodes):
+  '''Returns the website index.html (bytes) linking to every episode, newest first'''
+  with open(os.path.join(FIXTURES_DIR, "index_shell.html")) as f:
+    shell = f.read()
+  articles = '\n'.join(
+    f'<article id="post-{episode["number"]}" class="post"><div class="cat"><a href="episode{episode["number"]}.html">'
+    f'Episode {episode["number"]}</a></div><div class="entry-date published">{episode["release_date"]}</div>'
+    f'<h2><a href="episode{episode["number"]}.html">{html.escape(episode["name"])}</a></h2>'
+    f'<div class="excerpt">{html.escape(episode["description"])}<a class="more" href="episode{episode["number"]}.html">'
+    f'Read more</a></div></article>' for episode in reversed(episodes))
+  return shell.replace('{articles}', articles).encode('utf-8')
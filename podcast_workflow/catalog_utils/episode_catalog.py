@@ -0,0 +1,105 @@
+import logging
+import re
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+EPISODE_NUMBER_REGEXP = re.compile(r'episode\s*#?\s*(\d+)', re.IGNORECASE)
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS episodes (
+  episode_number INTEGER NOT NULL,
+  source TEXT NOT NULL,
+  name TEXT,
+  description TEXT,
+  url TEXT,
+  release_date TEXT,
+  updated_at REAL NOT NULL,
+  PRIMARY KEY (episode_number, source)
+);
+CREATE TABLE IF NOT EXISTS sources (
+  source TEXT PRIMARY KEY,
+  last_synced REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS content_hashes (
+  key TEXT PRIMARY KEY,
+  content_hash TEXT NOT NULL,
+  updated_at REAL NOT NULL
+);
+'''
+EPISODE_FIELDS = ('name', 'description', 'url', 'release_date')
+
+
+def parse_episode_number(episode_name):
+  '''Returns the episode number in a title like "Episode 12: Title Of Episode", or None'''
+  match = EPISODE_NUMBER_REGEXP.search(episode_name or '')
+  return int(match.group(1)) if match else None
+
+
+class EpisodeCatalog(object):
+  '''On-disk catalog of every episode as listed by each source (platform or
+  rss feed), keyed by episode number. Each source remembers when it was last
+  synced so callers only re-fetch sources whose data has gone stale.
+  '''
+
+  def __init__(self, db_path):
+    self.db_path = db_path
+    self.connection = sqlite3.connect(db_path)
+    self.connection.row_factory = sqlite3.Row
+    self.connection.executescript(SCHEMA)
+
+  def close(self):
+    self.connection.close()
+
+  def last_synced(self, source):
+    '''Returns the unix time source was last synced at, or None'''
+    row = self.connection.execute("SELECT last_synced FROM sources WHERE source = ?", (source,)).fetchone()
+    return row['last_synced'] if row else None
+
+  def is_stale(self, source, ttl):
+    '''True if source was never synced or was last synced more than ttl seconds ago'''
+    last_synced = self.last_synced(source)
+    return last_synced is None or time.time() - last_synced > ttl
+
+  def _episode_rows(self, source, episodes, now):
+    for episode in episodes:
+      episode_number = parse_episode_number(episode['name'])
+      if episode_number is None:
+        logger.warning(f"Skipping {source} episode without an episode number: {episode['name']}")
+        continue
+      yield (episode_number, source) + tuple(episode.get(field) for field in EPISODE_FIELDS) + (now,)
+
+  def replace_source(self, source, episodes):
+    '''Replaces everything known about source with episodes (dicts with
+    name, description, url and release_date) and marks it as synced.
+    '''
+    now = time.time()
+    with self.connection:
+      self.connection.execute("DELETE FROM episodes WHERE source = ?", (source,))
+      self.connection.executemany("INSERT OR REPLACE INTO episodes VALUES (?, ?, ?, ?, ?, ?, ?)",
+        self._episode_rows(source, episodes, now))
+      self.connection.execute("INSERT OR REPLACE INTO sources VALUES (?, ?)", (source, now))
+
+  def upsert_episode(self, source, episode):
+    '''Adds or updates a single episode of source without changing its last synced time'''
+    with self.connection:
+      self.connection.executemany("INSERT OR REPLACE INTO episodes VALUES (?, ?, ?, ?, ?, ?, ?)",
+        self._episode_rows(source, [episode], time.time()))
+
+  def episodes(self):
+    '''Returns dict of episode number -> dict of source -> episode, ordered by episode number'''
+    catalog = {}
+    for row in self.connection.execute("SELECT * FROM episodes ORDER BY episode_number, source"):
+      catalog.setdefault(row['episode_number'], {})[row['source']] = dict(row)
+    return catalog
+
+  def content_hashes(self):
+    '''Returns dict of key -> hash of the content last published under key'''
+    return {row['key']: row['content_hash'] for row in self.connection.execute("SELECT key, content_hash FROM content_hashes")}
+
+  def set_content_hashes(self, hashes):
+    '''Records the hashes (dict of key -> hash) of content that was published'''
+    now = time.time()
+    with self.connection:
+      self.connection.executemany("INSERT OR REPLACE INTO content_hashes VALUES (?, ?, ?)",
+        [(key, content_hash, now) for key, content_hash in hashes.items()])
@@ -0,0 +1,50 @@
+import hashlib
+import json
+
+NAME_PREFERENCE = ('Spotify', 'RSS', 'Apple', 'Google') # where an episode's name and description come from
+
+
+def missing_sources(catalog_episodes, sources):
+  '''Args:
+      catalog_episodes: dict of episode number -> dict of source -> episode, see EpisodeCatalog.episodes()
+      sources:          every source an episode should be listed by
+  Returns: dict of episode number -> list of the sources that don't list it, for incomplete episodes only
+  '''
+  missing = {}
+  for episode_number, episode_sources in catalog_episodes.items():
+    absent = [source for source in sources if source not in episode_sources]
+    if absent:
+      missing[episode_number] = absent
+  return missing
+
+
+def primary_episode(episode_sources, preference=NAME_PREFERENCE):
+  '''Returns the entry of the first source in preference that lists the episode'''
+  for source in preference:
+    if source in episode_sources:
+      return episode_sources[source]
+  return next(iter(episode_sources.values()))
+
+
+def content_hash(content, salt=''):
+  '''Returns a sha256 of json serializable content. salt is mixed in so that
+  e.g. a changed template invalidates every hash made with the old one.
+  '''
+  data = json.dumps(content, sort_keys=True, default=str).encode('utf-8')
+  return hashlib.sha256(salt.encode('utf-8') + b'\0' + data).hexdigest()
+
+
+def file_hash(path):
+  '''Returns the sha256 of a file's content'''
+  with open(path, "rb") as f:
+    return hashlib.sha256(f.read()).hexdigest()
+
+
+def changed_keys(hashes, known_hashes):
+  '''Returns the keys of hashes (dict of key -> hash) that are new or differ from known_hashes'''
+  return [key for key, value in hashes.items() if known_hashes.get(key) != value]
+
+
+def format_missing(missing):
+  '''Returns one line per incomplete episode, e.g. "Episode 12: missing Apple, Google"'''
+  return [f"Episode {episode_number}: missing {', '.join(sources)}" for episode_number, sources in sorted(missing.items())]
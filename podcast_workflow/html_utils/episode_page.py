@@ -0,0 +1,56 @@
+import json
+import os
+import re
+
+from functools import lru_cache
+from html_utils.templates import compile_template
+
+
+def _fill_episode_slots(soup, slot):
+  '''Marks the parts of the episode page template that change per episode'''
+  article = soup.find('article')
+  article.h1.string = slot('name')  # use episode title
+  article.find_all("div", "entry-date")[0].string = slot('release_date')
+  article.find_all("div", "content-header")[0].string = slot('description')
+  podcasts_links_div = article.find_all("div", "podcasts-list")[0]
+  podcasts_links_div.find_all(href=re.compile("apple"))[0]["href"] = slot('apple_podcast_url', attribute=True)
+  podcasts_links_div.find_all(href=re.compile("google"))[0]["href"] = slot('google_podcast_url', attribute=True)
+  podcasts_links_div.find_all(href=re.compile("spotify"))[0]["href"] = slot('spotify_url', attribute=True)
+  podcasts_links_div.find_all(href=re.compile("twitter"))[0]["href"] = slot('twitter_status_url', attribute=True)
+
+
+def compile_episode_template(template_html):
+  '''Parses the episode page template html once into a CompiledTemplate'''
+  from bs4 import BeautifulSoup
+
+  return compile_template(BeautifulSoup(template_html, "html.parser"), _fill_episode_slots)
+
+
+@lru_cache(maxsize=4)
+def _load_episode_template(template_path, modified_time, asset_map_json, image_map_json, image_sizes):
+  with open(template_path) as fp:
+    template_html = fp.read()
+  if asset_map_json:
+    from website_utils.asset_build import rewrite_html
+
+    template_html = rewrite_html(template_html, json.loads(asset_map_json))
+  if image_map_json:
+    from website_utils.image_build import rewrite_images
+
+    template_html = rewrite_images(template_html, json.loads(image_map_json), image_sizes)
+  return compile_episode_template(template_html)
+
+
+def load_episode_template(template_path, asset_map=None, image_map=None, image_sizes='100vw'):
+  '''Returns the compiled episode page template, only re-compiled when the file
+  (or the asset and image maps its links are rewritten with) changes
+  '''
+  asset_map_json = json.dumps(asset_map, sort_keys=True) if asset_map else None
+  image_map_json = json.dumps(image_map, sort_keys=True) if image_map else None
+  return _load_episode_template(template_path, os.path.getmtime(template_path), asset_map_json, image_map_json,
+    image_sizes)
+
+
+def render_episode_page(template, podcast_info):
+  '''Renders the html page of an episode (as utf-8 bytes) from the compiled template'''
+  return template.render(podcast_info).encode('utf-8')
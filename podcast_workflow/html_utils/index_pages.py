@@ -0,0 +1,148 @@
+import json
+
+from html_utils.templates import CompiledTemplate
+from html_utils.templates import compile_template
+
+DEFAULT_PAGE_SIZE = 10
+SUB_PAGE_HEAD = '<base href="../"/>' # pages under page/ resolve links from the site root
+
+
+def page_key(page_number, index_key="index.html"):
+  '''Returns the s3 key of a page of the index, page 1 being index.html'''
+  return index_key if page_number == 1 else f"page/{page_number}.html"
+
+
+def _fill_article_slots(soup, slot):
+  '''Marks the parts of an index article that change per episode'''
+  article = soup.find('article')
+  article['id'] = slot('post_id', attribute=True)
+  article.find_all("a")[0].string = slot('episode_label')
+  article.find_all("a")[0]["href"] = slot('file_name', attribute=True)
+  article.find("div", "entry-date published").string = slot('release_date')
+  article.find_all("a")[1].string = slot('name')
+  article.find_all("a")[1]["href"] = slot('file_name', attribute=True)
+  excerpt_a = article.find_all("a")[2]
+  excerpt_a["href"] = slot('file_name', attribute=True)
+  article.find("div", "excerpt").string = slot('description')
+  article.find("div", "excerpt").insert(1, excerpt_a)
+
+
+def _fill_shell_slots(soup, slot):
+  '''Empties blog-holder and marks where the articles and page links go'''
+  posts = soup.find("div", "blog-holder")
+  posts.clear()
+  posts.append(slot('articles'))
+  posts.insert_after(slot('pagination'))
+  soup.head.insert(0, slot('head_extra'))
+
+
+def create_manifest(index_html, page_size=DEFAULT_PAGE_SIZE):
+  '''Parses the current index.html once into a manifest holding the compiled
+  page shell, the compiled article template and the html of every article,
+  newest first. Every later update works on the manifest without parsing html.
+  '''
+  from bs4 import BeautifulSoup
+
+  soup = BeautifulSoup(index_html, "html.parser")
+  articles = soup.find("div", "blog-holder").find_all("article")
+  article_fragments = [article.prettify() for article in articles]
+
+  article_soup = BeautifulSoup(str(articles[0]), "html.parser")
+  article_template = compile_template(article_soup, _fill_article_slots)
+  shell_template = compile_template(soup, _fill_shell_slots)
+  return {
+    'page_size': page_size,
+    'shell': shell_template.to_dict(),
+    'article': article_template.to_dict(),
+    'articles': article_fragments
+  }
+
+
+def load_manifest(manifest_json):
+  return json.loads(manifest_json)
+
+
+def dump_manifest(manifest):
+  return json.dumps(manifest).encode('utf-8')
+
+
+def _article_values(podcast_info, post_number):
+  return dict(podcast_info, post_id=f"post-{post_number}", episode_label=f"Episode {podcast_info['episode_number']}")
+
+
+def render_article(manifest, podcast_info, post_number):
+  '''Returns the html of the index article of an episode'''
+  return CompiledTemplate.from_dict(manifest['article']).render(_article_values(podcast_info, post_number))
+
+
+def render_articles(manifest, podcast_infos):
+  '''Returns the html of the index articles of podcast_infos, numbered from 1 in order.
+  The article template is only loaded once for all of them.
+  '''
+  template = CompiledTemplate.from_dict(manifest['article'])
+  return [template.render(_article_values(podcast_info, idx+1)) for idx, podcast_info in enumerate(podcast_infos)]
+
+
+def page_count(manifest):
+  return max(1, -(-len(manifest['articles']) // manifest['page_size']))
+
+
+def add_article(manifest, article_html):
+  '''Puts a new article at the top of the first page. Every page shifts down
+  by one article, which is worked out on the article list alone.
+  Returns: list of the page numbers whose content changed
+  '''
+  manifest['articles'].insert(0, article_html)
+  return list(range(1, page_count(manifest) + 1))
+
+
+def set_articles(manifest, article_fragments):
+  '''Replaces every article (newest first). Returns: list of all page numbers'''
+  manifest['articles'] = list(article_fragments)
+  return list(range(1, page_count(manifest) + 1))
+
+
+def replace_articles(manifest, article_fragments):
+  '''Like set_articles, but only returns the pages whose articles changed.
+  When the number of pages changes every page is returned, since the page
+  links at the bottom of each page change too.
+  '''
+  old_articles = manifest['articles']
+  old_page_count = page_count(manifest)
+  set_articles(manifest, article_fragments)
+  last_page = page_count(manifest)
+  if last_page != old_page_count:
+    return list(range(1, last_page + 1))
+  page_size = manifest['page_size']
+  return [page_number for page_number in range(1, last_page + 1) \
+    if old_articles[(page_number - 1) * page_size:page_number * page_size] != \
+      manifest['articles'][(page_number - 1) * page_size:page_number * page_size]]
+
+
+def _pagination_html(page_number, last_page, index_key):
+  links = []
+  if page_number > 1:
+    links.append(f'<a class="newer" href="{page_key(page_number - 1, index_key)}">&larr; Newer episodes</a>')
+  if page_number < last_page:
+    links.append(f'<a class="older" href="{page_key(page_number + 1, index_key)}">Older episodes &rarr;</a>')
+  if not links:
+    return ''
+  return f'<div class="index-pagination">{"".join(links)}</div>'
+
+
+def render_pages(manifest, page_numbers, index_key="index.html"):
+  '''Renders the given pages of the index.
+  Returns: dict of s3 key -> page html as utf-8 bytes
+  '''
+  shell = CompiledTemplate.from_dict(manifest['shell'])
+  page_size = manifest['page_size']
+  last_page = page_count(manifest)
+  pages = {}
+  for page_number in page_numbers:
+    articles = manifest['articles'][(page_number - 1) * page_size:page_number * page_size]
+    pages[page_key(page_number, index_key)] = shell.render_raw({
+      'articles': '\n'.join(articles),
+      'pagination': _pagination_html(page_number, last_page, index_key),
+      'head_extra': SUB_PAGE_HEAD if page_number > 1 else ''
+    }).encode('utf-8')
+  return pages
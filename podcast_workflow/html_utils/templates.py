@@ -0,0 +1,70 @@
+import html
+import re
+
+SLOT_MARKER = "@@SLOT:{0}@@"
+SLOT_REGEXP = re.compile(r'@@SLOT:(\w+)@@')
+
+
+class CompiledTemplate(object):
+  '''An html page that has been parsed and prettified once and split into the
+  static text around its slots. Rendering is a plain join of that text with
+  the escaped slot values, no html parsing involved.
+  '''
+
+  def __init__(self, segments, slots):
+    '''Args:
+        segments: the static text, one more segment than there are slots
+        slots:    list of (slot name, is attribute) in the order they appear
+    '''
+    self.segments = segments
+    self.slots = slots
+
+  def render(self, values):
+    '''Returns the page with each slot replaced by its html escaped value'''
+    parts = [self.segments[0]]
+    for (name, is_attribute), segment in zip(self.slots, self.segments[1:]):
+      value = values.get(name)
+      parts.append(html.escape('' if value is None else str(value), quote=is_attribute))
+      parts.append(segment)
+    return ''.join(parts)
+
+  def to_dict(self):
+    return {'segments': self.segments, 'slots': self.slots}
+
+  @classmethod
+  def from_dict(cls, data):
+    return cls(data['segments'], [tuple(slot) for slot in data['slots']])
+
+  def render_raw(self, values):
+    '''Like render, but values are inserted as is (for slots holding html)'''
+    parts = [self.segments[0]]
+    for (name, _), segment in zip(self.slots, self.segments[1:]):
+      parts.append(values.get(name) or '')
+      parts.append(segment)
+    return ''.join(parts)
+
+
+def compile_template(soup, fill_slots):
+  '''Compiles a BeautifulSoup document into a CompiledTemplate.
+  Args:
+      soup:       the parsed template, it gets modified
+      fill_slots: function called with soup and a slot function. slot(name, attribute=False)
+                  returns a marker to assign to the element's string (or to one
+                  of its attributes when attribute is True)
+  '''
+  kinds = {}
+
+  def slot(name, attribute=False):
+    kinds[name] = attribute
+    return SLOT_MARKER.format(name)
+
+  fill_slots(soup, slot)
+  return split_template(soup.prettify(), kinds)
+
+
+def split_template(text, kinds):
+  '''Splits text on its slot markers. kinds maps slot name -> is attribute'''
+  pieces = SLOT_REGEXP.split(text)
+  segments = pieces[0::2]
+  slots = [(name, kinds.get(name, False)) for name in pieces[1::2]]
+  return CompiledTemplate(segments, slots)
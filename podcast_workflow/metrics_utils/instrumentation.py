@@ -0,0 +1,178 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_PREFIX = "podcast_workflow"
+PROMETHEUS_METRICS = (
+  # (metric name, stage total key, help text)
+  ('stage_duration_seconds', 'wall_time', "Wall time spent in a pipeline stage"),
+  ('stage_bytes', 'bytes', "Bytes transferred by a pipeline stage"),
+  ('stage_api_calls', 'api_calls', "API calls made by a pipeline stage"),
+  ('stage_runs', 'count', "Number of times a pipeline stage ran"),
+  ('stage_errors', 'errors', "Number of times a pipeline stage failed")
+)
+
+
+class Span(object):
+  '''A timed stage of a run, along with the bytes it transferred and the API calls it made'''
+
+  def __init__(self, name, labels, started):
+    self.name = name
+    self.labels = labels
+    self.started = started
+    self.wall_time = None
+    self.bytes = 0
+    self.api_calls = 0
+    self.error = None
+    self._lock = threading.Lock()
+
+  def add_bytes(self, count):
+    with self._lock:
+      self.bytes += count
+
+  def add_api_calls(self, count=1):
+    with self._lock:
+      self.api_calls += count
+
+  def to_dict(self):
+    return {'name': self.name, 'labels': self.labels, 'wall_time': self.wall_time, 'bytes': self.bytes,
+      'api_calls': self.api_calls, 'error': self.error}
+
+
+class RunMetrics(object):
+  '''Collects the spans of one run of the workflow.
+
+  Bytes and API calls are added to the innermost open span of the calling
+  thread. Threads that didn't open a span themselves (e.g. upload workers)
+  count towards the innermost span of the thread that started the run.
+  '''
+
+  def __init__(self, run_name="publish", clock=time.perf_counter):
+    self.run_name = run_name
+    self.clock = clock
+    self.started = clock()
+    self.started_at = time.time()
+    self.spans = []
+    self._lock = threading.Lock()
+    self._local = threading.local()
+    self._main_thread = threading.get_ident()
+    self._main_stack = []
+
+  def _stack(self):
+    if threading.get_ident() == self._main_thread:
+      return self._main_stack
+    if not hasattr(self._local, 'stack'):
+      self._local.stack = []
+    return self._local.stack
+
+  def current_span(self):
+    stack = self._stack() or self._main_stack
+    return stack[-1] if stack else None
+
+  @contextmanager
+  def span(self, name, **labels):
+    '''Times the body of the with statement as a span, which is yielded so the
+    body can add bytes and API calls to it. Exceptions are recorded on the
+    span and re-raised.
+    '''
+    span = Span(name, {key: str(value) for key, value in labels.items()}, self.clock() - self.started)
+    stack = self._stack()
+    stack.append(span)
+    try:
+      yield span
+    except BaseException as e:
+      span.error = f"{type(e).__name__}: {e}"
+      raise
+    finally:
+      stack.pop()
+      span.wall_time = self.clock() - self.started - span.started
+      with self._lock:
+        self.spans.append(span)
+      logger.debug(f"{name} {span.labels or ''} took {span.wall_time:.2f}s, {span.bytes} bytes, {span.api_calls} API calls")
+
+  def wrap(self, name, function, **labels):
+    '''Returns function made to run in a span of its own, e.g. to hand to fetch_all'''
+    def wrapped(*args, **kwargs):
+      with self.span(name, **labels):
+        return function(*args, **kwargs)
+    return wrapped
+
+  def add_bytes(self, count):
+    span = self.current_span()
+    if span is not None:
+      span.add_bytes(count)
+
+  def add_api_calls(self, count=1):
+    span = self.current_span()
+    if span is not None:
+      span.add_api_calls(count)
+
+  def stage_totals(self):
+    '''Returns list of per stage totals, spans with the same name and labels added up'''
+    totals = {}
+    with self._lock:
+      spans = list(self.spans)
+    for span in spans:
+      key = (span.name, tuple(sorted(span.labels.items())))
+      total = totals.setdefault(key, {'name': span.name, 'labels': span.labels, 'wall_time': 0.0, 'bytes': 0,
+        'api_calls': 0, 'count': 0, 'errors': 0})
+      total['wall_time'] += span.wall_time
+      total['bytes'] += span.bytes
+      total['api_calls'] += span.api_calls
+      total['count'] += 1
+      total['errors'] += 1 if span.error else 0
+    return list(totals.values())
+
+  def report(self):
+    with self._lock:
+      spans = [span.to_dict() for span in sorted(self.spans, key=lambda span: span.started)]
+    return {
+      'run': self.run_name,
+      'started_at': self.started_at,
+      'wall_time': self.clock() - self.started,
+      'stages': self.stage_totals(),
+      'spans': spans
+    }
+
+  def write_json(self, path):
+    _write_atomic(path, json.dumps(self.report(), indent=1))
+
+  def write_prometheus(self, path, prefix=PROMETHEUS_PREFIX):
+    '''Writes the stage totals in the Prometheus text format, for the node_exporter textfile collector'''
+    run_label = _label_pairs({'run': self.run_name})
+    lines = [
+      f"# HELP {prefix}_run_duration_seconds Wall time of the whole run",
+      f"# TYPE {prefix}_run_duration_seconds gauge",
+      f"{prefix}_run_duration_seconds{{{run_label}}} {self.clock() - self.started:.6f}",
+      f"# HELP {prefix}_run_timestamp_seconds Unix time the run started at",
+      f"# TYPE {prefix}_run_timestamp_seconds gauge",
+      f"{prefix}_run_timestamp_seconds{{{run_label}}} {self.started_at:.3f}"
+    ]
+    stages = self.stage_totals()
+    for metric, key, help_text in PROMETHEUS_METRICS:
+      lines.append(f"# HELP {prefix}_{metric} {help_text}")
+      lines.append(f"# TYPE {prefix}_{metric} gauge")
+      for stage in stages:
+        labels = _label_pairs(dict(stage['labels'], run=self.run_name, stage=stage['name']))
+        lines.append(f"{prefix}_{metric}{{{labels}}} {stage[key]}")
+    _write_atomic(path, '\n'.join(lines) + '\n')
+
+
+def _label_pairs(labels):
+  def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+  return ','.join(f'{key}="{escape(value)}"' for key, value in sorted(labels.items()))
+
+
+def _write_atomic(path, text):
+  # the textfile collector must never see a half written file
+  tmp_path = f"{path}.{os.getpid()}.tmp"
+  with open(tmp_path, "w") as f:
+    f.write(text)
+  os.replace(tmp_path, path)
@@ -0,0 +1,79 @@
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def audio_key(audio_file):
+  '''Identifies an episode's audio by its path, size and modification time,
+  so a journal is only resumed for the exact file it was started with.
+  '''
+  stat = os.stat(audio_file)
+  return f"{os.path.abspath(audio_file)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+class PublishJournal(object):
+  '''Durable record of the stages of an episode's publication. Each stage
+  stores its outputs (json) in the journal file as soon as it completes, so
+  a rerun after a failure reuses them instead of repeating the stage.
+  The journal belongs to one audio file; starting on a different one
+  discards it.
+  '''
+
+  def __init__(self, path, key):
+    self.path = path
+    self.key = key
+    self.entry = self._read()
+    if self.entry.get('key') != key:
+      if self.entry.get('stages') and not self.entry.get('completed'):
+        logger.warning(f"Discarding the unfinished journal of {self.entry.get('key')}")
+      self.entry = {'key': key, 'started': time.time(), 'stages': {}}
+
+  def _read(self):
+    try:
+      with open(self.path) as f:
+        return json.load(f)
+    except (OSError, ValueError):
+      return {}
+
+  def _write(self):
+    tmp_path = f"{self.path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+      json.dump(self.entry, f, indent=1)
+      f.flush()
+      os.fsync(f.fileno())
+    os.replace(tmp_path, self.path)
+
+  @property
+  def completed_stages(self):
+    return list(self.entry['stages'])
+
+  @property
+  def completed(self):
+    return self.entry.get('completed', False)
+
+  def done(self, stage):
+    return stage in self.entry['stages']
+
+  def get(self, stage, default=None):
+    return self.entry['stages'].get(stage, default)
+
+  def record(self, stage, output):
+    '''Stores the output of a completed stage'''
+    self.entry['stages'][stage] = output
+    self._write()
+    return output
+
+  def run(self, stage, fn, *args, **kwargs):
+    '''Returns the recorded output of stage, or runs fn and records what it returns'''
+    if self.done(stage):
+      logger.info(f"Reusing the journaled output of {stage}")
+      return self.get(stage)
+    return self.record(stage, fn(*args, **kwargs))
+
+  def complete(self):
+    '''Marks the whole publication as done'''
+    self.entry['completed'] = True
+    self._write()
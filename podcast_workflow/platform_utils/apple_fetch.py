@@ -0,0 +1,89 @@
+import json
+import logging
+import re
+
+from platform_utils import http_session
+
+logger = logging.getLogger(__name__)
+
+LOOKUP_URL = "https://itunes.apple.com/lookup"
+LOOKUP_LIMIT = 200 # most episodes the lookup endpoint returns
+SHOEBOX_SCRIPT_ID = "shoebox-ember-data-store"
+SHOEBOX_SCRIPT_TYPE = "fastboot/shoebox"
+EPISODE_TYPE = "media/podcast-episode"
+REQUEST_TIMEOUT = 30
+SCRIPT_REGEXP = re.compile(r'<script\b([^>]*)>(.*?)</script>', re.DOTALL | re.IGNORECASE)
+SHOEBOX_ID_REGEXP = r'\bid\s*=\s*["\']' + re.escape(SHOEBOX_SCRIPT_ID) + r'["\']'
+SHOEBOX_TYPE_REGEXP = r'\btype\s*=\s*["\']' + re.escape(SHOEBOX_SCRIPT_TYPE) + r'["\']'
+
+
+def get_podcast_id(podcast_url):
+  '''Returns the numeric podcast ID in an Apple Podcasts URL like .../id1234567890'''
+  match = re.search(r'/id(\d+)', podcast_url)
+  if not match:
+    raise ValueError(f"No podcast ID found in {podcast_url}")
+  return match.group(1)
+
+
+def _episode_key(episode_url):
+  '''Episodes are identified by the i= parameter of their URL'''
+  match = re.search(r'[?&]i=(\d+)', episode_url)
+  return match.group(1) if match else episode_url
+
+
+def get_shoebox_data(html):
+  '''Returns the decoded json of the shoebox-ember-data-store script in an Apple Podcasts page.
+  The script is cut out of the page with a regular expression, the rest of the page isn't parsed.
+  '''
+  for match in SCRIPT_REGEXP.finditer(html):
+    attributes = match.group(1)
+    if re.search(SHOEBOX_ID_REGEXP, attributes) and re.search(SHOEBOX_TYPE_REGEXP, attributes):
+      return json.loads(match.group(2))
+  raise ValueError("Apple Podcasts page has no shoebox data")
+
+
+def _shoebox_episodes(shoebox_data):
+  return [{'name': episode['attributes']['name'], 'description': episode['attributes']['description']['standard'], \
+    'publication_timestamp_millis': episode['attributes']['releaseDateTime'], 'url': episode['attributes']['url']} \
+    for episode in shoebox_data.get('included', []) if episode['type'] == EPISODE_TYPE]
+
+
+def _lookup_episodes(podcast_id, get):
+  response = get(LOOKUP_URL, params={'id': podcast_id, 'entity': 'podcastEpisode', 'limit': LOOKUP_LIMIT},
+    timeout=REQUEST_TIMEOUT)
+  response.raise_for_status()
+  return [{'name': result['trackName'], 'description': result.get('description', ''), \
+    'publication_timestamp_millis': result['releaseDate'], 'url': result['trackViewUrl'].replace('&uo=4', '')} \
+    for result in response.json()['results'] if result.get('wrapperType') == 'podcastEpisode']
+
+
+def get_all_apple_episodes(podcast_url, get=None):
+  '''Fetches every episode of a podcast from Apple over plain HTTP.
+  Episodes are read from the json embedded in the podcast page and from the
+  iTunes lookup endpoint, and merged by episode ID.
+  Args:
+      podcast_url: the Apple Podcasts URL of the podcast
+      get:         function used to make the GET requests, the shared http session by default [optional]
+  Returns:
+      list of episode dicts (name, description, publication_timestamp_millis, url)
+      and the number of episodes Apple says the podcast has
+  '''
+  if get is None:
+    get = http_session.get
+
+  response = get(podcast_url, timeout=REQUEST_TIMEOUT)
+  response.raise_for_status()
+  shoebox_data = get_shoebox_data(response.text)
+  track_count = shoebox_data["data"]["attributes"]["trackCount"]
+
+  episodes = {}
+  try:
+    for episode in _lookup_episodes(get_podcast_id(podcast_url), get):
+      episodes[_episode_key(episode['url'])] = episode
+  except Exception as e:
+    logger.warning(f"iTunes lookup failed, only using the podcast page: {e}")
+  for episode in _shoebox_episodes(shoebox_data):
+    episodes.setdefault(_episode_key(episode['url']), episode)
+
+  logger.info(f"Found {len(episodes)} of {track_count} Apple episodes over HTTP")
+  return list(episodes.values()), track_count
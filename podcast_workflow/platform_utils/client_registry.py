@@ -0,0 +1,131 @@
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+TOKEN_EXPIRY_MARGIN = 60 # seconds before expires_at that a cached token counts as expired
+
+
+class ClientRegistry(object):
+  '''Creates each platform client once per process and hands the same
+  instance to every caller. Clients are built by the factory registered under
+  their name the first time they are asked for. Tests and benchmarks can
+  inject ready made clients (fakes) with set().
+  '''
+
+  def __init__(self, factories=None):
+    self._factories = dict(factories or {})
+    self._clients = {}
+    self._lock = threading.Lock() # guards _clients and _client_locks, never held while a client is created
+    self._client_locks = {}
+
+  def register(self, name, factory):
+    '''factory is called without arguments and returns the client'''
+    self._factories[name] = factory
+
+  def set(self, name, client):
+    with self._lock:
+      self._clients[name] = client
+
+  def _client_lock(self, name):
+    with self._lock:
+      return self._client_locks.setdefault(name, threading.Lock())
+
+  def get(self, name):
+    with self._lock:
+      if name in self._clients:
+        return self._clients[name]
+    if name not in self._factories:
+      raise KeyError(f"No client registered as {name}")
+
+    # clients are created under a lock of their own, so a slow login only holds up callers of that client
+    with self._client_lock(name):
+      with self._lock:
+        if name in self._clients:
+          return self._clients[name]
+      started = time.perf_counter()
+      client = self._factories[name]()
+      logger.debug(f"Created {name} client in {time.perf_counter() - started:.2f}s")
+      with self._lock:
+        return self._clients.setdefault(name, client)
+
+  def reset(self, name=None):
+    '''Forgets one client (or all of them), they are created again on next use'''
+    with self._lock:
+      if name is None:
+        self._clients.clear()
+      else:
+        self._clients.pop(name, None)
+
+
+class TokenCache(object):
+  '''Keeps OAuth/bearer token dicts (with an expires_at timestamp) in a json
+  file, so that a new process can reuse a token until it expires instead of
+  requesting a new one.
+  '''
+
+  def __init__(self, path):
+    self.path = path
+    self._lock = threading.Lock()
+
+  def _read(self):
+    try:
+      with open(self.path) as f:
+        return json.load(f)
+    except (OSError, ValueError):
+      return {}
+
+  def load(self, name):
+    '''Returns the cached token of name, or None when it is missing or about to expire'''
+    token_info = self._read().get(name)
+    if not token_info or token_info.get('expires_at', 0) - TOKEN_EXPIRY_MARGIN < time.time():
+      return None
+    return token_info
+
+  def save(self, name, token_info):
+    with self._lock:
+      tokens = self._read()
+      tokens[name] = token_info
+      tmp_path = f"{self.path}.{os.getpid()}.tmp"
+      with open(tmp_path, "w") as f:
+        json.dump(tokens, f)
+      os.replace(tmp_path, self.path)
+
+
+def spotify_client(client_id, client_secret, token_cache=None, requests_session=True):
+  '''Returns a spotipy.Spotify using client credentials. With a token_cache the
+  access token is taken from it while still valid, otherwise it is requested
+  and stored there. spotipy renews it in memory when it expires.
+  API calls go through requests_session when it is a requests.Session.
+  '''
+  import spotipy
+  from spotipy.oauth2 import SpotifyClientCredentials
+
+  credentials = SpotifyClientCredentials(client_id=client_id, client_secret=client_secret)
+  if token_cache is not None:
+    credentials.token_info = token_cache.load('spotify')
+    if credentials.token_info is None:
+      credentials.get_access_token(as_dict=False)
+      token_cache.save('spotify', credentials.token_info)
+  return spotipy.Spotify(client_credentials_manager=credentials, requests_session=requests_session)
+
+
+def google_music_client(device_id, oauth_path):
+  '''Returns a logged in gmusicapi Mobileclient. The oauth file holds the
+  refresh token, so logging in only needs the access token refreshed.
+  '''
+  from gmusicapi import Mobileclient
+
+  mc = Mobileclient()
+  # mc.perform_oauth() only needed once (can be avoided by providing an oauth file)
+  mc.oauth_login(device_id, oauth_path)
+  return mc
+
+
+def twitter_client(consumer_key, consumer_secret, access_token_key, access_token_secret):
+  import twitter
+
+  return twitter.Api(consumer_key, consumer_secret, access_token_key, access_token_secret)
@@ -0,0 +1,59 @@
+import logging
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 120
+
+
+def fetch_all(fetchers, timeouts=None, default_timeout=DEFAULT_TIMEOUT):
+  '''Runs every fetcher on its own thread so the total time is that of the
+  slowest fetcher rather than the sum of all of them.
+  Args:
+      fetchers:        dict of name -> callable taking no arguments
+      timeouts:        dict of name -> seconds to wait for that fetcher [optional]
+      default_timeout: seconds to wait for fetchers without an entry in timeouts
+  Returns:
+      dictionary containing:
+        - results: dict of name -> return value, for the fetchers that succeeded
+        - errors: dict of name -> exception, for the fetchers that failed or timed out
+        - elapsed: dict of name -> seconds taken by the fetcher (or waited for it)
+  Note:
+      A fetcher that times out can't be interrupted, it keeps running in the
+      background and its result is discarded.
+  '''
+  timeouts = timeouts or {}
+  report = {'results': {}, 'errors': {}, 'elapsed': {}}
+  if not fetchers:
+    return report
+
+  def timed(name, fetcher):
+    started = time.monotonic()
+    try:
+      return fetcher()
+    finally:
+      report['elapsed'][name] = time.monotonic() - started
+
+  start = time.monotonic()
+  executor = ThreadPoolExecutor(max_workers=len(fetchers))
+  futures = {name: executor.submit(timed, name, fetcher) for name, fetcher in fetchers.items()}
+  try:
+    for name, future in futures.items():
+      remaining = start + timeouts.get(name, default_timeout) - time.monotonic()
+      try:
+        report['results'][name] = future.result(timeout=max(remaining, 0))
+      except TimeoutError:
+        report['elapsed'].setdefault(name, time.monotonic() - start)
+        report['errors'][name] = TimeoutError(f"{name} did not respond within {timeouts.get(name, default_timeout)}s")
+      except Exception as e:
+        report['errors'][name] = e
+  finally:
+    executor.shutdown(wait=False)
+
+  for name, error in report['errors'].items():
+    logger.warning(f"Fetching from {name} failed: {error}")
+  logger.info(f"Fetched {len(report['results'])}/{len(fetchers)} sources in {time.monotonic() - start:.1f}s")
+  return report
@@ -0,0 +1,47 @@
+from functools import lru_cache
+
+DEFAULT_TIMEOUT = (5, 30) # seconds to connect, seconds between bytes of the response
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 1 # retries wait 1, 2, 4... seconds
+DEFAULT_POOL_SIZE = 10
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+response_hooks = [] # called with every response of sessions created from here, e.g. to count API calls
+
+
+def _retry(retries, backoff):
+  from urllib3.util.retry import Retry
+
+  kwargs = {'total': retries, 'backoff_factor': backoff, 'status_forcelist': RETRY_STATUSES, 'raise_on_status': False}
+  try:
+    return Retry(allowed_methods=frozenset(['GET', 'HEAD']), **kwargs)
+  except TypeError:
+    # urllib3 before 1.26
+    return Retry(method_whitelist=frozenset(['GET', 'HEAD']), **kwargs)
+
+
+def create_session(retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, pool_size=DEFAULT_POOL_SIZE):
+  '''Returns a requests.Session that keeps connections alive, asks for gzip
+  responses and retries failed GETs with exponential backoff
+  '''
+  import requests
+  from requests.adapters import HTTPAdapter
+
+  session = requests.Session()
+  adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=_retry(retries, backoff))
+  session.mount('https://', adapter)
+  session.mount('http://', adapter)
+  session.headers['Accept-Encoding'] = 'gzip, deflate'
+  session.hooks['response'].extend(response_hooks)
+  return session
+
+
+@lru_cache(maxsize=None)
+def get_session():
+  '''The session shared by every platform fetch in this process'''
+  return create_session()
+
+
+def get(url, **kwargs):
+  '''requests.get through the shared session, with a timeout unless one is given'''
+  kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+  return get_session().get(url, **kwargs)
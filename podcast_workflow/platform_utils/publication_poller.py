@@ -0,0 +1,81 @@
+import logging
+import random
+import time
+
+from platform_utils.concurrent_fetch import DEFAULT_TIMEOUT
+from platform_utils.concurrent_fetch import fetch_all
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INITIAL_DELAY = 60
+DEFAULT_MAX_DELAY = 300
+DEFAULT_BACKOFF = 2
+DEFAULT_JITTER = 0.2
+
+
+def _next_delay(delay, backoff, max_delay, jitter):
+  '''Grows delay exponentially up to max_delay and spreads it by +/- jitter'''
+  delay = min(delay * backoff, max_delay)
+  return delay * random.uniform(1 - jitter, 1 + jitter)
+
+
+def wait_for_publication(checks, deadline, initial_delay=DEFAULT_INITIAL_DELAY, max_delay=DEFAULT_MAX_DELAY,
+  backoff=DEFAULT_BACKOFF, jitter=DEFAULT_JITTER, check_timeout=DEFAULT_TIMEOUT, sleep=time.sleep, clock=time.monotonic):
+  '''Polls each platform on its own exponential backoff schedule until every
+  platform reports the new episode or deadline seconds have passed. Platforms
+  that are due at the same time are checked concurrently.
+  Args:
+      checks:   dict of platform name -> callable returning (published, info).
+                Exceptions raised by a check count as "not published yet".
+      deadline: number of seconds to keep polling for
+      check_timeout: seconds to wait for a single check before counting it as failed
+  Returns:
+      dict of platform name -> dictionary containing:
+        - published: True if the platform reported the new episode in time
+        - info: the info returned by the last successful check (or None)
+        - attempts: number of times the platform was checked
+        - error: the last error raised by the check (or None)
+  '''
+  start = clock()
+  status = {name: {'published': False, 'info': None, 'attempts': 0, 'error': None} for name in checks}
+  next_check = {name: start + initial_delay for name in checks}
+  delays = {name: initial_delay for name in checks}
+
+  while True:
+    pending = [name for name in checks if not status[name]['published']]
+    if not pending:
+      logger.info(f"All platforms published after {int(clock() - start)}s")
+      break
+
+    due_at = min(next_check[name] for name in pending)
+    if due_at > start + deadline:
+      logger.warning(f"Deadline of {deadline}s reached, still waiting on: {', '.join(pending)}")
+      break
+
+    wait_for = due_at - clock()
+    if wait_for > 0:
+      sleep(wait_for)
+
+    # platforms which are due together are checked concurrently
+    due = [name for name in pending if next_check[name] <= max(clock(), due_at)]
+    report = fetch_all({name: checks[name] for name in due}, default_timeout=check_timeout)
+    for name in due:
+      status[name]['attempts'] += 1
+      if name in report['results']:
+        published, info = report['results'][name]
+        status[name].update({'published': published, 'info': info, 'error': None})
+      else:
+        logger.debug(f"Checking {name} failed: {report['errors'][name]}")
+        status[name]['error'] = report['errors'][name]
+
+      if status[name]['published']:
+        print(f"{name} published the new episode after {int(clock() - start)}s")
+      else:
+        delays[name] = _next_delay(delays[name], backoff, max_delay, jitter)
+        next_check[name] = clock() + delays[name]
+        # always get one last check in right at the deadline
+        if next_check[name] > start + deadline and clock() < start + deadline:
+          next_check[name] = start + deadline
+        logger.info(f"{name} has not published the new episode yet, checking again in {int(delays[name])}s")
+
+  return status
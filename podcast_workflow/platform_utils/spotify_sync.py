@@ -0,0 +1,103 @@
+import json
+import logging
+import os
+
+from operator import itemgetter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 50 # largest page the show episodes endpoint returns
+DEFAULT_MARKET = "US"
+DEFAULT_SHOW_SEARCH = "fourth official soccer podcast"
+CACHED_FIELDS = ('id', 'name', 'description', 'release_date', 'external_urls')
+
+
+class SpotifyEpisodeSync(object):
+  '''Keeps a local cache of a show's Spotify episodes up to date.
+
+  The show's episode listing is paged newest first and paging stops at the
+  first episode that is already cached, so the number of API calls grows with
+  the number of new episodes instead of the size of the back catalogue.
+  '''
+
+  def __init__(self, sp, cache_path, show_id=None, market=DEFAULT_MARKET, page_size=DEFAULT_PAGE_SIZE,
+    show_search=DEFAULT_SHOW_SEARCH):
+    '''Args:
+        sp:          authenticated spotipy.Spotify client
+        cache_path:  path of the json file the known episodes are kept in
+        show_id:     Spotify ID of the show, looked up with show_search when missing [optional]
+    '''
+    self.sp = sp
+    self.cache_path = cache_path
+    self.market = market
+    self.page_size = page_size
+    self.show_search = show_search
+    self.cache = self._load_cache()
+    if show_id and show_id != self.cache.get('show_id'):
+      self.cache = {'show_id': show_id, 'episodes': []}
+    self.synced = False
+
+  def _load_cache(self):
+    if not os.path.exists(self.cache_path):
+      return {'show_id': None, 'episodes': []}
+    try:
+      with open(self.cache_path) as f:
+        return json.load(f)
+    except ValueError as e:
+      logger.warning(f"Ignoring unreadable Spotify cache {self.cache_path}: {e}")
+      return {'show_id': None, 'episodes': []}
+
+  def _save_cache(self):
+    tmp_path = f"{self.cache_path}.tmp"
+    with open(tmp_path, "w") as f:
+      json.dump(self.cache, f)
+    os.replace(tmp_path, self.cache_path)
+
+  @property
+  def show_id(self):
+    if not self.cache.get('show_id'):
+      result = self.sp.search(self.show_search, limit=1, type="show", market=self.market)
+      self.cache['show_id'] = result['shows']['items'][0]['id']
+      logger.info(f"Resolved Spotify show ID {self.cache['show_id']}")
+    return self.cache['show_id']
+
+  def sync(self, full_refresh=False):
+    '''Fetches the episodes published since the last sync.
+    full_refresh re-reads the whole listing, e.g. to pick up edited descriptions.
+    Returns: list of the newly found episodes, newest first
+    '''
+    known_ids = set() if full_refresh else {episode['id'] for episode in self.cache['episodes']}
+    new_episodes = []
+    offset = 0
+    api_calls = 0
+    while True:
+      result = self.sp.show_episodes(self.show_id, limit=self.page_size, offset=offset, market=self.market)
+      api_calls += 1
+      items = [item for item in result['items'] if item]
+      fresh = [{field: item[field] for field in CACHED_FIELDS} for item in items if item['id'] not in known_ids]
+      new_episodes.extend(fresh)
+      if len(fresh) < len(items) or not result.get('next'):
+        break
+      offset += self.page_size
+    logger.info(f"Found {len(new_episodes)} new Spotify episodes with {api_calls} API calls")
+
+    if full_refresh:
+      self.cache['episodes'] = new_episodes
+    else:
+      self.cache['episodes'] = new_episodes + self.cache['episodes']
+    self._save_cache()
+    self.synced = True
+    return new_episodes
+
+  def _episodes(self):
+    if not self.synced:
+      self.sync()
+    return self.cache['episodes']
+
+  def latest_episode(self):
+    '''Returns the most recently released episode'''
+    return max(self._episodes(), key=itemgetter('release_date'))
+
+  def all_episodes(self):
+    '''Returns every episode, oldest first'''
+    return sorted(self._episodes(), key=itemgetter('release_date'))
@@ -0,0 +1,115 @@
+import re
+import xml.etree.ElementTree as ET
+
+from xml.sax.saxutils import escape
+from xml.sax.saxutils import quoteattr
+from xml.sax.saxutils import unescape
+
+ITEM_START_REGEXP = re.compile(rb'<item[\s>]')
+ITEM_END = b'</item>'
+CHANNEL_END = b'</channel>'
+CDATA_REGEXP = re.compile(r'^\s*<!\[CDATA\[(.*)\]\]>\s*$', re.DOTALL)
+
+
+def _element_regexp(local_name):
+  '''Matches an element by local name whatever its namespace prefix, e.g. duration
+  matches <itunes:duration>...</itunes:duration> as well as <duration/>
+  '''
+  name = r'(?:[\w.-]+:)?' + re.escape(local_name)
+  return re.compile(r'<(' + name + r')(\s[^>]*?)?(?:/>|>(.*?)</\1\s*>)', re.DOTALL)
+
+
+def last_item(feed):
+  '''Returns the xml of the last <item> in the feed (bytes in, str out),
+  found by searching backwards from the end of the feed
+  '''
+  end = feed.rfind(ITEM_END)
+  if end == -1:
+    raise ValueError("Feed has no <item>")
+  start = feed.rfind(b'<item', 0, end)
+  while start != -1 and not ITEM_START_REGEXP.match(feed, start):
+    start = feed.rfind(b'<item', 0, start)
+  if start == -1:
+    raise ValueError("Feed has no <item>")
+  return feed[start:end + len(ITEM_END)].decode('utf-8')
+
+
+def count_items(feed):
+  '''Returns the number of <item> elements in the feed'''
+  return len(ITEM_START_REGEXP.findall(feed))
+
+
+def get_text(item_xml, local_name):
+  '''Returns the text of the first element with this local name in item_xml, or None'''
+  match = _element_regexp(local_name).search(item_xml)
+  if not match or match.group(3) is None:
+    return None
+  text = match.group(3)
+  cdata = CDATA_REGEXP.match(text)
+  return cdata.group(1) if cdata else unescape(text, {'&quot;': '"', '&apos;': "'"})
+
+
+def set_text(item_xml, local_name, text):
+  '''Sets the text of every element with this local name in item_xml'''
+  def replace(match):
+    return f"<{match.group(1)}{match.group(2) or ''}>{escape(text)}</{match.group(1)}>"
+  return _element_regexp(local_name).sub(replace, item_xml)
+
+
+def set_attributes(item_xml, local_name, attributes):
+  '''Sets attributes on every element with this local name in item_xml'''
+  def replace(match):
+    element = match.group(0)
+    for attribute, value in attributes.items():
+      value = quoteattr(str(value))
+      element, count = re.subn(r'(\s' + re.escape(attribute) + r')\s*=\s*(".*?"|\'.*?\')', lambda m: f"{m.group(1)}={value}", element, count=1)
+      if not count:
+        element = re.sub(r'^(<[^\s/>]+)', lambda m: f"{m.group(1)} {attribute}={value}", element)
+    return element
+  return _element_regexp(local_name).sub(replace, item_xml)
+
+
+def find_item(feed, url):
+  '''Returns the xml of the first <item> whose guid or enclosure url is url, or None'''
+  if url.encode('utf-8') not in feed and escape(url).encode('utf-8') not in feed:
+    return None
+  position = 0
+  while True:
+    match = ITEM_START_REGEXP.search(feed, position)
+    if not match:
+      return None
+    end = feed.find(ITEM_END, match.end())
+    if end == -1:
+      return None
+    position = end + len(ITEM_END)
+    item_xml = feed[match.start():position].decode('utf-8')
+    enclosure = _element_regexp('enclosure').search(item_xml)
+    enclosure_url = re.search(r'\surl\s*=\s*(?:"(.*?)"|\'(.*?)\')', enclosure.group(0)) if enclosure else None
+    if get_text(item_xml, 'guid') == url or \
+      (enclosure_url and unescape(enclosure_url.group(1) or enclosure_url.group(2) or '', {'&quot;': '"', '&apos;': "'"}) == url):
+      return item_xml
+
+
+def append_item(feed, item_xml):
+  '''Splices item_xml in as the last child of <channel>, without parsing the feed'''
+  end = feed.rfind(CHANNEL_END)
+  if end == -1:
+    raise ValueError("Feed has no </channel>")
+  return feed[:end] + item_xml.encode('utf-8') + feed[end:]
+
+
+def iter_items(stream, fields):
+  '''Yields a dict of field -> text for every <item> in the feed read from
+  stream, in a single streaming pass. Items are discarded as soon as they have
+  been read so memory use doesn't grow with the size of the feed.
+  Namespaced fields are given as {namespace-uri}name.
+  '''
+  channel = None
+  for event, element in ET.iterparse(stream, events=('start', 'end')):
+    if event == 'start':
+      if element.tag == 'channel':
+        channel = element
+    elif element.tag == 'item':
+      yield {field: element.findtext(field) for field in fields}
+      if channel is not None:
+        channel.clear()
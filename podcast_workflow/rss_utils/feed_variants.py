@@ -0,0 +1,75 @@
+import re
+
+from xml.sax.saxutils import escape
+
+from rss_utils.feed import ITEM_END
+from rss_utils.feed import ITEM_START_REGEXP
+
+SELF_LINK_REGEXP = re.compile(rb'<(?:[\w.-]+:)?link\b[^>]*?\brel\s*=\s*["\']self["\'][^>]*>')
+HREF_REGEXP = re.compile(rb'\bhref\s*=\s*(["\'])(.*?)\1')
+FEED_CONTENT_TYPE = 'application/rss+xml'
+DEFAULT_RECENT_EPISODES = 20
+DEFAULT_CACHE_CONTROL = 'public, max-age=300'
+
+
+def recent_key(rss_key):
+  '''Returns the s3 key of the recent episodes feed, e.g. podcast.xml -> podcast_recent.xml'''
+  name, dot, extension = rss_key.rpartition('.')
+  return f"{name}_recent.{extension}" if dot else f"{rss_key}_recent"
+
+
+def item_spans(feed):
+  '''Returns list of (start, end) offsets of every <item> in the feed'''
+  spans = []
+  position = 0
+  while True:
+    match = ITEM_START_REGEXP.search(feed, position)
+    if not match:
+      return spans
+    end = feed.find(ITEM_END, match.end())
+    if end == -1:
+      raise ValueError("Feed has an unclosed <item>")
+    position = end + len(ITEM_END)
+    spans.append((match.start(), position))
+
+
+def recent_feed(feed, count):
+  '''Returns a copy of the feed holding only its last count items. The channel
+  header and the end of the document are kept as they are.
+  '''
+  spans = item_spans(feed)
+  if len(spans) <= count:
+    return feed
+  first_kept = spans[-count][0] if count > 0 else spans[-1][1]
+  return feed[:spans[0][0]] + feed[first_kept:]
+
+
+def set_self_link(feed, rss_key, key):
+  '''Points the channel's atom:link rel="self" of a copy of the feed at rss_key to
+  the url of key instead, e.g. .../podcast.xml -> .../podcast_recent.xml.
+  Feeds without a self link are returned as they are.
+  '''
+  first_item = ITEM_START_REGEXP.search(feed)
+  link = SELF_LINK_REGEXP.search(feed, 0, first_item.start() if first_item else len(feed))
+  href = HREF_REGEXP.search(link.group(0)) if link else None
+  if not href:
+    return feed
+  url = href.group(2).decode('utf-8')
+  if url.endswith(rss_key):
+    url = url[:-len(rss_key)] + key
+  else:
+    url = f"{url.rpartition('/')[0]}/{key.rpartition('/')[2]}"
+  start, end = link.start() + href.start(2), link.start() + href.end(2)
+  return feed[:start] + escape(url, {'"': '&quot;', "'": '&apos;'}).encode('utf-8') + feed[end:]
+
+
+def feed_objects(feed, rss_key, recent_episodes=DEFAULT_RECENT_EPISODES, cache_control=DEFAULT_CACHE_CONTROL, recent_rss_key=None):
+  '''Builds the full and the recent episodes feed from the same feed bytes.
+  Both are stored uncompressed: s3 serves an object with the same encoding to
+  every client, and gzip bodies break the clients that don't ask for them.
+  Returns: dict of s3 key -> (body, dict of extra put_object args)
+  '''
+  recent_rss_key = recent_rss_key or recent_key(rss_key)
+  recent = set_self_link(recent_feed(feed, recent_episodes), rss_key, recent_rss_key)
+  extra_args = {'ACL': 'public-read', 'ContentType': FEED_CONTENT_TYPE, 'CacheControl': cache_control}
+  return {rss_key: (feed, extra_args), recent_rss_key: (recent, dict(extra_args))}
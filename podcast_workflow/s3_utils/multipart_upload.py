@@ -0,0 +1,215 @@
+import base64
+import hashlib
+import logging
+import threading
+import time
+
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+MIN_PART_SIZE = 5 * MB # smallest part size s3 accepts (except for the last part)
+DEFAULT_PART_SIZE = 8 * MB
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_MAX_RETRIES = 3
+SHA256_TAG_KEY = 'sha256'
+
+
+class UploadIntegrityError(Exception):
+  '''Raised when the ETag returned by s3 doesn't match the one computed locally'''
+
+
+def progress_printer(total_size, label="Upload"):
+  '''Returns a thread safe progress callback which prints the percentage
+  uploaded every time another 10% of total_size has gone through.
+  Follows the boto3 Callback convention of being called with the number
+  of bytes transferred since the last call.
+  '''
+  lock = threading.Lock()
+  state = {'transferred': 0, 'last_reported': -1}
+
+  def callback(bytes_amount):
+    with lock:
+      state['transferred'] += bytes_amount
+      percent = int(state['transferred'] * 100 / total_size) if total_size else 100
+      if percent // 10 > state['last_reported']:
+        state['last_reported'] = percent // 10
+        print(f"{label}: {percent}% ({state['transferred']}/{total_size} bytes)")
+
+  return callback
+
+
+def find_existing_object(s3_client, bucket, prefix, size, local_sha256):
+  '''Looks for an object under prefix with the same size and sha256 tag as the
+  local file. Only objects with a matching size are inspected, and local_sha256
+  (a callable) is only invoked when there is at least one such candidate.
+  Returns: key of the matching object or None
+  '''
+  paginator = s3_client.get_paginator('list_objects_v2')
+  candidates = [obj['Key'] for page in paginator.paginate(Bucket=bucket, Prefix=prefix) \
+    for obj in page.get('Contents', []) if obj['Size'] == size]
+  if not candidates:
+    return None
+
+  digest = local_sha256()
+  for key in candidates:
+    try:
+      tag_set = s3_client.get_object_tagging(Bucket=bucket, Key=key)['TagSet']
+    except Exception as e:
+      logger.warning(f"Could not read tags of {key}: {e}")
+      continue
+    tags = {tag['Key']: tag['Value'] for tag in tag_set}
+    if tags.get(SHA256_TAG_KEY) == digest:
+      return key
+  return None
+
+
+def _iter_parts(chunks, part_size):
+  '''Re-slices an iterable of byte chunks into part_size parts'''
+  buffer = bytearray()
+  for chunk in chunks:
+    buffer.extend(chunk)
+    while len(buffer) >= part_size:
+      yield bytes(buffer[:part_size])
+      del buffer[:part_size]
+  if buffer:
+    yield bytes(buffer)
+
+
+def _with_retries(action, description, max_retries, backoff=1):
+  '''Runs action, retrying with exponential backoff up to max_retries times'''
+  attempt = 0
+  while True:
+    try:
+      return action()
+    except Exception as e:
+      if attempt >= max_retries:
+        logger.error(f"{description} failed after {attempt + 1} attempts: {e}")
+        raise
+      delay = backoff * (2 ** attempt)
+      logger.warning(f"{description} failed ({e}), retrying in {delay}s")
+      time.sleep(delay)
+      attempt += 1
+
+
+def _check_etag(key, etag, expected_etag):
+  if etag != expected_etag:
+    raise UploadIntegrityError(f"ETag mismatch for {key}: s3 returned {etag}, expected {expected_etag}")
+
+
+def _put_single(s3_client, bucket, key, body, extra_args, max_retries, progress_callback):
+  md5 = hashlib.md5(body)
+  response = _with_retries(lambda: s3_client.put_object(Bucket=bucket, Key=key, Body=body,
+    ContentMD5=base64.b64encode(md5.digest()).decode('ascii'), **extra_args), f"Upload of {key}", max_retries)
+  if progress_callback:
+    progress_callback(len(body))
+  etag = response['ETag'].strip('"')
+  try:
+    _check_etag(key, etag, md5.hexdigest())
+  except UploadIntegrityError:
+    s3_client.delete_object(Bucket=bucket, Key=key)
+    raise
+  return etag
+
+
+def _put_multipart(s3_client, bucket, key, parts, extra_args, max_workers, max_retries, progress_callback, hashers):
+  upload_id = s3_client.create_multipart_upload(Bucket=bucket, Key=key, **extra_args)['UploadId']
+  part_md5s = {}
+
+  def abort():
+    # an upload that is never completed or aborted keeps its parts stored (and billed)
+    try:
+      s3_client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+    except Exception as e:
+      logger.error(f"Aborting the upload of {key} failed: {e}")
+
+  def upload_part(part_number, body, md5):
+    response = _with_retries(lambda: s3_client.upload_part(Bucket=bucket, Key=key, UploadId=upload_id,
+      PartNumber=part_number, Body=body, ContentMD5=base64.b64encode(md5).decode('ascii')),
+      f"Part {part_number} of {key}", max_retries)
+    if progress_callback:
+      progress_callback(len(body))
+    return {'PartNumber': part_number, 'ETag': response['ETag']}
+
+  # parts are read (and hashed) in order on this thread and handed to the pool.
+  # At most 2 * max_workers parts are held in memory at any time.
+  completed_parts = []
+  try:
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+      pending = set()
+      for part_number, body in enumerate(parts, start=1):
+        for hasher in hashers:
+          hasher.update(body)
+        part_md5s[part_number] = hashlib.md5(body).digest()
+        pending.add(executor.submit(upload_part, part_number, body, part_md5s[part_number]))
+        if len(pending) >= 2 * max_workers:
+          done, pending = wait(pending, return_when=FIRST_COMPLETED)
+          completed_parts.extend(future.result() for future in done)
+      completed_parts.extend(future.result() for future in pending)
+  except Exception:
+    abort()
+    raise
+
+  # multipart ETag is the md5 of the concatenated part md5s, suffixed with the part count
+  joined_md5s = b''.join(part_md5s[number] for number in sorted(part_md5s))
+  expected_etag = f"{hashlib.md5(joined_md5s).hexdigest()}-{len(part_md5s)}"
+
+  completed_parts = sorted(completed_parts, key=lambda part: part['PartNumber'])
+  try:
+    response = s3_client.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id,
+      MultipartUpload={'Parts': completed_parts})
+    etag = response['ETag'].strip('"')
+    _check_etag(key, etag, expected_etag)
+  except UploadIntegrityError:
+    # the upload was completed, so it is the object that doesn't match that has to go
+    s3_client.delete_object(Bucket=bucket, Key=key)
+    raise
+  except Exception:
+    abort()
+    raise
+  return etag
+
+
+def upload_chunks(s3_client, chunks, bucket, key, size, part_size=DEFAULT_PART_SIZE, max_workers=DEFAULT_MAX_WORKERS,
+  max_retries=DEFAULT_MAX_RETRIES, progress_callback=None, extra_args=None):
+  '''Uploads an iterable of byte chunks totalling size bytes to s3.
+  Objects larger than part_size are sent as a multipart upload with max_workers
+  parts in flight, each part retried up to max_retries times. The sha256 and md5
+  of the content are computed as it is uploaded, the resulting ETag is checked
+  against the locally computed one and the sha256 is stored as an object tag.
+     Returns:
+       - dictionary containing:
+         - key: the key of the object in s3
+         - etag: the ETag s3 reported for the object
+         - sha256: hex sha256 of the uploaded content
+         - size: number of bytes uploaded
+         - skipped: False, the object was uploaded
+  '''
+  extra_args = extra_args or {}
+  part_size = max(part_size, MIN_PART_SIZE)
+  sha256 = hashlib.sha256()
+  parts = _iter_parts(chunks, part_size)
+
+  if size <= part_size:
+    body = b''.join(parts)
+    sha256.update(body)
+    etag = _put_single(s3_client, bucket, key, body, extra_args, max_retries, progress_callback)
+  else:
+    etag = _put_multipart(s3_client, bucket, key, parts, extra_args, max_workers,
+      max_retries, progress_callback, [sha256])
+
+  s3_client.put_object_tagging(Bucket=bucket, Key=key,
+    Tagging={'TagSet': [{'Key': SHA256_TAG_KEY, 'Value': sha256.hexdigest()}]})
+  logger.debug(f"Uploaded {key} ({size} bytes, sha256 {sha256.hexdigest()})")
+
+  return {
+    'key': key,
+    'etag': etag,
+    'sha256': sha256.hexdigest(),
+    'size': size,
+    'skipped': False
+  }
+
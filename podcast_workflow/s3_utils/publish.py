@@ -0,0 +1,91 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 8
+
+
+def list_remote_etags(s3_client, bucket, prefix=''):
+  '''Returns dict of key -> ETag (without quotes) for every object under prefix'''
+  paginator = s3_client.get_paginator('list_objects_v2')
+  return {obj['Key']: obj['ETag'].strip('"') for page in paginator.paginate(Bucket=bucket, Prefix=prefix) \
+    for obj in page.get('Contents', [])}
+
+
+def load_publish_manifest(manifest_path):
+  '''Returns dict of key -> md5 of the objects published from this machine'''
+  if not manifest_path or not os.path.exists(manifest_path):
+    return {}
+  with open(manifest_path) as f:
+    return json.load(f)
+
+
+def save_publish_manifest(manifest_path, manifest):
+  tmp_path = f"{manifest_path}.tmp"
+  with open(tmp_path, "w") as f:
+    json.dump(manifest, f, indent=1, sort_keys=True)
+  os.replace(tmp_path, manifest_path)
+
+
+def publish_objects(s3_client, bucket, objects, manifest_path=None, max_workers=DEFAULT_MAX_WORKERS):
+  '''Uploads the objects whose content differs from what is already in s3.
+  Args:
+      objects:       dict of key -> (body as bytes, dict of extra put_object args such as ACL and ContentType)
+      manifest_path: json file of key -> md5 of previously published objects. When
+                     given it is used instead of listing the ETags in the bucket [optional]
+      max_workers:   number of uploads to run at once
+  Returns:
+      dictionary containing:
+        - uploaded: number of objects uploaded
+        - skipped: number of objects which were unchanged
+        - bytes_uploaded: bytes sent to s3
+        - bytes_saved: bytes that didn't need to be sent
+        - failed: dict of key -> exception for the uploads that failed
+  '''
+  report = {'uploaded': 0, 'skipped': 0, 'bytes_uploaded': 0, 'bytes_saved': 0, 'failed': {}}
+  if not objects:
+    return report
+
+  # single part uploads have the md5 of their content as ETag
+  digests = {key: hashlib.md5(body).digest() for key, (body, _) in objects.items()}
+  if manifest_path:
+    known_md5s = load_publish_manifest(manifest_path)
+  else:
+    known_md5s = list_remote_etags(s3_client, bucket)
+
+  changed_keys = []
+  for key, (body, _) in objects.items():
+    if known_md5s.get(key) == digests[key].hex():
+      report['skipped'] += 1
+      report['bytes_saved'] += len(body)
+    else:
+      changed_keys.append(key)
+
+  def upload(key):
+    body, extra_args = objects[key]
+    s3_client.put_object(Bucket=bucket, Key=key, Body=body,
+      ContentMD5=base64.b64encode(digests[key]).decode('ascii'), **extra_args)
+
+  with ThreadPoolExecutor(max_workers=max_workers) as executor:
+    futures = {key: executor.submit(upload, key) for key in changed_keys}
+  for key, future in futures.items():
+    try:
+      future.result()
+      report['uploaded'] += 1
+      report['bytes_uploaded'] += len(objects[key][0])
+      known_md5s[key] = digests[key].hex()
+    except Exception as e:
+      logger.error(f"Uploading {key} failed: {e}")
+      report['failed'][key] = e
+
+  if manifest_path:
+    save_publish_manifest(manifest_path, known_md5s)
+  logger.info(f"Published to {bucket}: {report['uploaded']} uploaded, {report['skipped']} unchanged, "
+    f"{report['bytes_saved']} bytes saved, {len(report['failed'])} failed")
+  return report
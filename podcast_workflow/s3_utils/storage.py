@@ -0,0 +1,80 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+NOT_MODIFIED_CODES = ('304', 'NotModified')
+
+
+class S3Storage(object):
+  '''Reads and writes s3 objects as bytes, without going through local files.
+
+  Objects that have been read are remembered along with their ETag, and are
+  only downloaded again when s3 says they changed (a conditional GET with
+  If-None-Match). With a cache_dir, that cache survives between runs.
+  '''
+
+  def __init__(self, s3_client, cache_dir=None):
+    self.s3_client = s3_client
+    self.cache_dir = cache_dir
+    self._cache = {}
+    self._lock = threading.Lock()
+    if cache_dir:
+      os.makedirs(cache_dir, exist_ok=True)
+
+  def _cache_path(self, bucket, key):
+    return os.path.join(self.cache_dir, hashlib.sha1(f"{bucket}/{key}".encode('utf-8')).hexdigest())
+
+  def _cached(self, bucket, key):
+    '''Returns the cached (etag, body) of an object, or None'''
+    with self._lock:
+      if (bucket, key) in self._cache:
+        return self._cache[(bucket, key)]
+    if not self.cache_dir:
+      return None
+    path = self._cache_path(bucket, key)
+    try:
+      with open(f"{path}.json") as f:
+        etag = json.load(f)['etag']
+      with open(path, "rb") as f:
+        return etag, f.read()
+    except (OSError, ValueError, KeyError):
+      return None
+
+  def _remember(self, bucket, key, etag, body):
+    with self._lock:
+      self._cache[(bucket, key)] = (etag, body)
+    if not self.cache_dir:
+      return
+    # written under a per process name and moved into place, so concurrent runs don't clash
+    path = self._cache_path(bucket, key)
+    for target, data, mode in ((path, body, "wb"), (f"{path}.json", json.dumps({'bucket': bucket, 'key': key, 'etag': etag}), "w")):
+      tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+      with open(tmp_path, mode) as f:
+        f.write(data)
+      os.replace(tmp_path, target)
+
+  def get_bytes(self, bucket, key):
+    '''Returns the content of an object, downloading it only if it changed since it was last read'''
+    cached = self._cached(bucket, key)
+    kwargs = {'IfNoneMatch': cached[0]} if cached else {}
+    try:
+      response = self.s3_client.get_object(Bucket=bucket, Key=key, **kwargs)
+    except Exception as e:
+      error_code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+      if cached and error_code in NOT_MODIFIED_CODES:
+        logger.debug(f"{bucket}/{key} not modified, using cached copy")
+        return cached[1]
+      raise
+    body = response['Body'].read()
+    self._remember(bucket, key, response['ETag'], body)
+    return body
+
+  def put_bytes(self, bucket, key, body, **extra_args):
+    '''Uploads body (bytes) as an object. extra_args are passed on to put_object, e.g. ACL, ContentType'''
+    response = self.s3_client.put_object(Bucket=bucket, Key=key, Body=body, **extra_args)
+    self._remember(bucket, key, response['ETag'], body)
+    return response
@@ -35,8 +35,8 @@
 # This file demonstrates how to shorten all URLs contained within a Tweet
 # by passing the tweet text to a shortener. In this case, we're using TinyURL
 # since it does not require any real authentication for our purposes. If you
-# are using a different service to shorten URLs, then you will need to modify
-# the ShortenURL class to suit your needs.
+# are using a different service to shorten URLs, then pass ShortenURL a
+# provider with a Shorten(session, long_url) method, see TinyURLProvider.
 
 # Note that this example shortens all URLs contained within the Tweet text.
 
@@ -47,39 +47,168 @@
 
 # If you need assistance with obtaining keys from Twitter, see the instructions
 # in doc/getting_started.rst.
+import hashlib
+import json
+import os
 import re
-try:
-    from urllib.request import urlopen
-except:
-    from urllib2 import urlopen
+import threading
 
-from twitter import Api
-from twitter.twitter_utils import URL_REGEXP
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# python-twitter is only imported by the functions posting to Twitter, so the
+# shortener itself can be used (e.g. with StubProvider) without it installed
+
+
+class TinyURLProvider(object):
+    """ Shortens URLs with the TinyURL API, which needs no authentication. """
+
+    api_url = "https://tinyurl.com/api-create.php"
+
+    def Shorten(self,
+                session,
+                long_url):
+        """ Call TinyURL API and return the shortened URL.
+
+        Args:
+            session:  requests.Session to make the call with
+            long_url: URL string to shorten
+
+        Returns:
+            The shortened URL as a string
+        """
+        response = session.get(self.api_url, params={'url': long_url},
+                               timeout=30)
+        response.raise_for_status()
+        return response.text.strip()
+
+
+class StubProvider(object):
+    """ Offline provider which makes up a short URL from a hash of the long
+    URL. Useful for tests and benchmarks, nothing is sent over the network. """
+
+    def __init__(self,
+                 base_url="https://short.invalid/"):
+        self.base_url = base_url
+        self.calls = 0
+
+    def Shorten(self,
+                session,
+                long_url):
+        self.calls += 1
+        digest = hashlib.sha1(long_url.encode('utf8')).hexdigest()[:8]
+        return "{0}{1}".format(self.base_url, digest)
+
+
+PROVIDERS = {
+    'tinyurl': TinyURLProvider,
+    'stub': StubProvider
+}
+
+
+class URLCache(object):
+    """ A map of long URL -> short URL, saved as a json file. The least
+    recently used entries are evicted once there are more than max_entries. """
+
+    def __init__(self,
+                 path=None,
+                 max_entries=1000):
+        """
+        Args:
+            path:        json file to keep the cache in. Without a path the
+                         cache only lives in memory [optional]
+            max_entries: number of URLs to remember
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self._entries = OrderedDict(json.load(f))
+            except ValueError:
+                pass
+
+    def Get(self,
+            long_url):
+        with self._lock:
+            short_url = self._entries.get(long_url)
+            if short_url is not None:
+                self._entries.move_to_end(long_url)
+            return short_url
+
+    def Set(self,
+            long_url,
+            short_url):
+        with self._lock:
+            self._entries[long_url] = short_url
+            self._entries.move_to_end(long_url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def Save(self):
+        if not self.path:
+            return
+        with self._lock:
+            entries = list(self._entries.items())
+        tmp_path = "{0}.tmp".format(self.path)
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f, indent=1)
+        os.replace(tmp_path, self.path)
 
 
 class ShortenURL(object):
     """ A class that defines the default URL Shortener.
 
-    TinyURL is provided as the default and as an example helper class to make
-    URL Shortener calls if/when required. """
+    TinyURL is provided as the default provider. Shortened URLs are cached,
+    and all calls go through one keep-alive HTTP session. """
 
     def __init__(self,
                  userid=None,
-                 password=None):
-        """Instantiate a new ShortenURL object. TinyURL, which is used for this
-        example, does not require a userid or password, so you can try this
+                 password=None,
+                 provider=None,
+                 cache=None,
+                 session=None,
+                 max_workers=4):
+        """Instantiate a new ShortenURL object. TinyURL, which is used by
+        default, does not require a userid or password, so you can try this
         out without specifying either.
 
         Args:
-            userid:   userid for any required authorization call [optional]
-            password: password for any required authorization call [optional]
+            userid:      userid for any required authorization call [optional]
+            password:    password for any required authorization call [optional]
+            provider:    object with a Shorten(session, long_url) method,
+                         defaults to TinyURLProvider [optional]
+            cache:       URLCache to look URLs up in before shortening them,
+                         defaults to an in memory cache [optional]
+            session:     requests.Session to reuse [optional]
+            max_workers: number of URLs to shorten at once in ShortenMany
         """
         self.userid = userid
         self.password = password
+        self.provider = provider or TinyURLProvider()
+        self.cache = cache or URLCache()
+        self.max_workers = max_workers
+        self._session = session
+
+    @property
+    def session(self):
+        """ The HTTP session, created on first use so that offline providers
+        never need requests. """
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            self._session = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=self.max_workers)
+            self._session.mount('https://', adapter)
+            self._session.mount('http://', adapter)
+        return self._session
 
     def Shorten(self,
                 long_url):
-        """ Call TinyURL API and returned shortened URL result.
+        """ Return the shortened URL, from the cache if it was shortened before.
 
         Args:
             long_url: URL string to shorten
@@ -90,25 +219,33 @@ class ShortenURL(object):
         Note:
             long_url is required and no checks are made to ensure completeness
         """
+        short_url = self.cache.Get(long_url)
+        if short_url is None:
+            short_url = self.provider.Shorten(self.session, long_url)
+            self.cache.Set(long_url, short_url)
+        return short_url
 
-        result = None
-        f = urlopen("http://tinyurl.com/api-create.php?url={0}".format(
-            long_url))
-        try:
-            result = f.read()
-        finally:
-            f.close()
+    def ShortenMany(self,
+                    long_urls):
+        """ Shorten several URLs at once. Only URLs missing from the cache are
+        sent to the provider, concurrently, and the cache is saved once after.
 
-        # The following check is required for py2/py3 compatibility, since
-        # urlopen on py3 returns a bytes-object, and urlopen on py2 returns a
-        # string.
-        if isinstance(result, bytes):
-            return result.decode('utf8')
-        else:
-            return result
+        Args:
+            long_urls: list of URL strings to shorten
+
+        Returns:
+            dict of long URL -> shortened URL
+        """
+        unique_urls = list(OrderedDict.fromkeys(long_urls))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            short_urls = list(executor.map(self.Shorten, unique_urls))
+        self.cache.Save()
+        return dict(zip(unique_urls, short_urls))
 
 
 def _get_api():
+    from twitter import Api
+
     # Either specify a set of keys here or use os.getenv('CONSUMER_KEY') style
     # assignment:
 
@@ -128,15 +265,18 @@ def _get_api():
 
 
 def PostStatusWithShortenedURL(status):
+    from twitter.twitter_utils import URL_REGEXP
+
     shortener = ShortenURL()
     api = _get_api()
 
     # Find all URLs contained within the status message. Value of ``urls`` will
     # be a list.
     urls = re.findall(URL_REGEXP, status)
+    short_urls = shortener.ShortenMany(urls)
 
     for url in urls:
-        status = status.replace(url, shortener.Shorten(url), 1)
+        status = status.replace(url, short_urls[url], 1)
 
     api.PostUpdate(status)
 
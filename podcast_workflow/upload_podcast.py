@@ -1,143 +1,318 @@
-import boto3
-import copy
+import time
+_module_load_started = time.perf_counter()
+
+import argparse
 import configparser
+import io
 import json
 import logging
 import os
 import ntpath
-import pdb
-import pprint
 import pytz
 import re
-import requests
-import shutil
-import spotipy
-import time
-import twitter
-import xml.etree.ElementTree as ET
+import sys
 
-from twitter_utils.shorten_urls import ShortenURL
-from twitter.twitter_utils import calc_expected_status_length
-from bs4 import BeautifulSoup
+from audio_utils.ingest import AudioIngest
+from catalog_utils import reconcile
+from catalog_utils.episode_catalog import EpisodeCatalog
+from catalog_utils.episode_catalog import parse_episode_number
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from datetime import timedelta
-from gmusicapi import Mobileclient
-from mutagen.mp3 import MP3
+from functools import lru_cache
+from html_utils import index_pages
+from html_utils.episode_page import load_episode_template
+from html_utils.episode_page import render_episode_page
+from metrics_utils.instrumentation import RunMetrics
 from operator import itemgetter
-from selenium import webdriver
-from selenium.webdriver.firefox.options import Options
-from spotipy.oauth2 import SpotifyClientCredentials
-
-# global clients
-sts_client = boto3.client('sts')
-sts_client.get_session_token()
-s3_client = boto3.client('s3')
-s3 = boto3.resource('s3')
+from pipeline_utils import journal
+from pipeline_utils.journal import PublishJournal
+from platform_utils import client_registry
+from platform_utils import http_session
+from platform_utils.apple_fetch import EPISODE_TYPE
+from platform_utils.apple_fetch import get_all_apple_episodes
+from platform_utils.apple_fetch import get_shoebox_data
+from platform_utils.client_registry import ClientRegistry
+from platform_utils.client_registry import TokenCache
+from platform_utils.concurrent_fetch import fetch_all
+from platform_utils.publication_poller import wait_for_publication
+from platform_utils.spotify_sync import SpotifyEpisodeSync
+from rss_utils import feed
+from rss_utils import feed_variants
+from s3_utils import multipart_upload
+from s3_utils.publish import publish_objects
+from s3_utils.storage import S3Storage
+from website_utils import asset_build
+from website_utils import image_build
+
+# boto3, bs4, gmusicapi, requests, selenium, spotipy and twitter are slow to import,
+# so they are only imported by the functions that need them
+
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
 config = configparser.ConfigParser()
 config.read('config.ini')
+startup_budget = 0.5 # seconds the light subcommands may take to start
 
 # file vars
 eastern = pytz.timezone('US/Eastern')
-episodes_bucket_name = config['DEFAULT']['EPISODES_BUCKET_NAME']
-html_template_local_file_name = config['DEFAULT']['HTML_TEMPLATE_LOCAL_FILENAME']
-index_html_local_file_name = config['DEFAULT']['INDEX_HTML_LOCAL_FILENAME']
-index_html_remote_file_name = config['DEFAULT']['INDEX_HTML_REMOTE_FILENAME']
-rss_local_file_name = config['DEFAULT']['RSS_LOCAL_FILENAME']
-rss_remote_file_name = config['DEFAULT']['RSS_REMOTE_FILENAME']
+episodes_bucket_name = config['DEFAULT'].get('EPISODES_BUCKET_NAME')
+html_template_local_file_name = config['DEFAULT'].get('HTML_TEMPLATE_LOCAL_FILENAME')
+index_html_remote_file_name = config['DEFAULT'].get('INDEX_HTML_REMOTE_FILENAME')
+index_manifest_remote_file_name = config['DEFAULT'].get('INDEX_MANIFEST_REMOTE_FILENAME', fallback='index_manifest.json')
+index_page_size = config['DEFAULT'].getint('INDEX_PAGE_SIZE', fallback=10)
+rss_remote_file_name = config['DEFAULT'].get('RSS_REMOTE_FILENAME')
+rss_recent_remote_file_name = config['DEFAULT'].get('RSS_RECENT_REMOTE_FILENAME')
+rss_recent_episodes = config['DEFAULT'].getint('RSS_RECENT_EPISODES', fallback=feed_variants.DEFAULT_RECENT_EPISODES)
+rss_cache_control = config['DEFAULT'].get('RSS_CACHE_CONTROL', fallback=feed_variants.DEFAULT_CACHE_CONTROL)
 wait_time = 1800 # wait time is 30 minutes
-website_bucket_name = config['DEFAULT']['WEBSITE_BUCKET_NAME']
+website_bucket_name = config['DEFAULT'].get('WEBSITE_BUCKET_NAME')
+required_config_keys = ['EPISODES_BUCKET_NAME', 'HTML_TEMPLATE_LOCAL_FILENAME', 'INDEX_HTML_REMOTE_FILENAME',
+  'RSS_REMOTE_FILENAME', 'WEBSITE_BUCKET_NAME']
+
+# platform vars
+publish_deadline = config['DEFAULT'].getint('PUBLISH_DEADLINE_SECONDS', fallback=wait_time)
+publish_poll_initial_delay = config['DEFAULT'].getint('PUBLISH_POLL_INITIAL_DELAY_SECONDS', fallback=60)
+publish_poll_max_delay = config['DEFAULT'].getint('PUBLISH_POLL_MAX_DELAY_SECONDS', fallback=300)
+platform_fetch_timeout = config['DEFAULT'].getint('PLATFORM_FETCH_TIMEOUT_SECONDS', fallback=120)
+bulk_fetch_timeout = config['DEFAULT'].getint('BULK_FETCH_TIMEOUT_SECONDS', fallback=3600)
+apple_selenium_fallback = config['DEFAULT'].getboolean('APPLE_SELENIUM_FALLBACK', fallback=False)
+
+# catalog vars, each source is only re-fetched once its data is older than its ttl
+catalog_file_name = config['DEFAULT'].get('CATALOG_FILEPATH', fallback='episode_catalog.db')
+website_local_dir = config['DEFAULT'].get('WEBSITE_LOCAL_DIR', fallback=os.path.join('..', 'fourth_official_website'))
+asset_map_file_name = config['DEFAULT'].get('ASSET_MAP_FILEPATH', fallback='asset_map.json')
+asset_cache_control = config['DEFAULT'].get('ASSET_CACHE_CONTROL', fallback=asset_build.DEFAULT_CACHE_CONTROL)
+image_map_file_name = config['DEFAULT'].get('IMAGE_MAP_FILEPATH', fallback='image_map.json')
+image_cache_dir = config['DEFAULT'].get('IMAGE_CACHE_DIR', fallback='image_cache')
+image_dirs = [image_dir.strip() for image_dir in config['DEFAULT'].get('IMAGE_DIRS', fallback='images,demo-images').split(',')]
+image_widths = [int(width) for width in config['DEFAULT'].get('IMAGE_WIDTHS', fallback='160,320,640,1280').split(',')]
+image_quality = config['DEFAULT'].getint('IMAGE_QUALITY', fallback=image_build.DEFAULT_QUALITY)
+image_sizes = config['DEFAULT'].get('IMAGE_SIZES', fallback=image_build.DEFAULT_SIZES)
+publish_journal_file_name = config['DEFAULT'].get('PUBLISH_JOURNAL_FILEPATH', fallback='publish_journal.json')
+catalog_ttls = {
+  'RSS': config['DEFAULT'].getint('CATALOG_RSS_TTL_SECONDS', fallback=3600),
+  'Spotify': config['DEFAULT'].getint('CATALOG_SPOTIFY_TTL_SECONDS', fallback=6*3600),
+  'Google': config['DEFAULT'].getint('CATALOG_GOOGLE_TTL_SECONDS', fallback=6*3600),
+  'Apple': config['DEFAULT'].getint('CATALOG_APPLE_TTL_SECONDS', fallback=24*3600)
+}
+
+# upload tuning
+upload_part_size = config['DEFAULT'].getint('UPLOAD_PART_SIZE_MB', fallback=8) * multipart_upload.MB
+upload_max_workers = config['DEFAULT'].getint('UPLOAD_MAX_WORKERS', fallback=4)
+upload_max_retries = config['DEFAULT'].getint('UPLOAD_MAX_RETRIES', fallback=3)
+batch_upload_workers = config['DEFAULT'].getint('BATCH_UPLOAD_WORKERS', fallback=3)
+s3_cache_dir = config['DEFAULT'].get('S3_CACHE_DIR')
+publish_max_workers = config['DEFAULT'].getint('PUBLISH_MAX_WORKERS', fallback=8)
+publish_manifest_file_name = config['DEFAULT'].get('PUBLISH_MANIFEST_FILEPATH')
+write_id3_tags = config['DEFAULT'].getboolean('WRITE_ID3_TAGS', fallback=False)
+episode_artwork_file_name = config['DEFAULT'].get('EPISODE_ARTWORK_FILEPATH')
+
+# url shortener vars
+shortener_provider = config['DEFAULT'].get('SHORTENER_PROVIDER', fallback='tinyurl')
+shortener_cache_file_name = config['DEFAULT'].get('SHORTENER_CACHE_FILEPATH', fallback='shortened_urls.json')
+shortener_cache_max_entries = config['DEFAULT'].getint('SHORTENER_CACHE_MAX_ENTRIES', fallback=1000)
+
+
+# metrics vars, every run writes a json report and optionally a Prometheus textfile
+metrics_report_file_name = config['DEFAULT'].get('METRICS_REPORT_FILEPATH', fallback='run_metrics.json')
+metrics_prometheus_file_name = config['DEFAULT'].get('METRICS_PROMETHEUS_FILEPATH')
+metrics = RunMetrics()
+
+# global clients, created once per process the first time they are needed
+spotify_token_cache_file_name = config['DEFAULT'].get('SPOTIFY_TOKEN_CACHE_FILEPATH', fallback='spotify_token_cache.json')
+
+def create_s3_client():
+  import boto3
+  s3_client = boto3.client('s3')
+  s3_client.meta.events.register('before-call.s3', lambda **kwargs: metrics.add_api_calls())
+  return s3_client
+
+def count_http_response(response, *args, **kwargs):
+  metrics.add_api_calls()
+  metrics.add_bytes(len(response.content))
+
+http_session.response_hooks.append(count_http_response)
+
+def create_spotify_client():
+  here = os.path.dirname(os.path.realpath(__file__))
+  token_cache = TokenCache(os.path.join(here, spotify_token_cache_file_name))
+  # spotipy shares the platform session, so its API calls are counted by count_http_response
+  return client_registry.spotify_client(config['DEFAULT']['SPOTIPY_CLIENT_ID'], config['DEFAULT']['SPOTIPY_CLIENT_SECRET'],
+    token_cache=token_cache, requests_session=http_session.get_session())
 
-def push_new_episode_audio():
-  '''Pushes a new episode's audio file to s3
+def create_google_music_client():
+  here = os.path.dirname(os.path.realpath(__file__))
+  return client_registry.google_music_client(config['DEFAULT']['DEVICE_ID'], os.path.join(here, config['DEFAULT']['OAUTH_FILEPATH']))
+
+def create_twitter_client():
+  return client_registry.twitter_client(config['DEFAULT']['TWITTER_CONSUMER_KEY'], config['DEFAULT']['TWITTER_CONSUMER_SECRET'],
+    config['DEFAULT']['TWITTER_ACCESS_TOKEN_KEY'], config['DEFAULT']['TWITTER_ACCESS_TOKEN_SECRET'])
+
+clients = ClientRegistry({
+  's3': create_s3_client,
+  'spotify': create_spotify_client,
+  'google': create_google_music_client,
+  'twitter': create_twitter_client
+})
+
+def get_s3_client():
+  return clients.get('s3')
+
+@lru_cache(maxsize=None)
+def get_storage():
+  cache_dir = None
+  if s3_cache_dir:
+    here = os.path.dirname(os.path.realpath(__file__))
+    cache_dir = os.path.join(here, s3_cache_dir)
+  return S3Storage(get_s3_client(), cache_dir=cache_dir)
+
+def push_new_episode_audio(audio_file=None):
+  '''Pushes a new episode's audio file to s3, asking for its path unless given
      Returns:
        - dictionary containing:
          - size: size of audio (in bytes)
          - duration of episode (in hours/minutes/seconds)
          - audio_url: the s3 URL of the audio
          - s3_obj_name: the name of the audio in s3
+         - sha256/md5: the hashes of the uploaded audio
+         - title: the episode title, when ID3 tags were written
   '''
+  if audio_file is None:
+    audio_file = prompt_audio_file()
+
+  title = None
+  if write_id3_tags:
+    title = input("Enter episode title: e.g. Episode 12: Title Of Episode\n")
+  return upload_episode_audio(audio_file, title)
+
+def prompt_audio_file():
   print("Only use use alphanumeric characters and common symbols in title and description. Don't use quotes or other special characters.")
-  audio_file = input(f"Enter exact path of final version of podcast: e.g. C:/file/file.mp3\n")
-  
-  # get audio duration and size
-  audio = MP3(audio_file)
-  duration = str(timedelta(seconds=int(audio.info.length)))
-  size = str(os.path.getsize(audio_file))
+  return input(f"Enter exact path of final version of podcast: e.g. C:/file/file.mp3\n")
+
+def upload_episode_audio(audio_file, title=None):
+  '''Uploads an episode's audio file to s3 without prompting for anything.
+     The title is written into the ID3 tags when WRITE_ID3_TAGS is set.
+     Returns: the audio metadata described in push_new_episode_audio(), with the title when given
+  '''
+  tags = None
+  if write_id3_tags and title:
+    tags = {'title': title, 'episode_number': get_episode_number(title), 'artwork': episode_artwork_file_name}
 
+  # duration, size and hashes are all worked out while the audio streams to s3
   s3_obj_name = ntpath.basename(audio_file)
-  with open(audio_file, "rb") as f:
+  with metrics.span('audio_upload') as span, \
+    AudioIngest(audio_file, chunk_size=upload_part_size, tags=tags) as ingest:
     try:
-      s3_client.upload_fileobj(f, episodes_bucket_name, f"episodes/{s3_obj_name}", ExtraArgs={'ACL': 'public-read'})
-      logger.debug("Uploaded file successfully.")
-      return {
-        'audio_url': f"https://{episodes_bucket_name}.s3.amazonaws.com/episodes/{s3_obj_name}",
-        's3_obj_name': s3_obj_name,
-        'duration': duration,
-        'size': size
-      }
+      # the audio is only read ahead of the upload if an object of the same size exists
+      existing_key = multipart_upload.find_existing_object(get_s3_client(), episodes_bucket_name, "episodes/",
+        ingest.size, lambda: ingest.consume()['sha256'])
+      if existing_key:
+        s3_obj_name = existing_key[len("episodes/"):]
+        print(f"Audio already in s3 as {existing_key}, skipped upload.")
+      else:
+        multipart_upload.upload_chunks(get_s3_client(), ingest.chunks(), episodes_bucket_name, f"episodes/{s3_obj_name}",
+          ingest.size, part_size=upload_part_size, max_workers=upload_max_workers, max_retries=upload_max_retries,
+          progress_callback=multipart_upload.progress_printer(ingest.size, s3_obj_name),
+          extra_args={'ACL': 'public-read', 'ContentType': 'audio/mpeg'})
+        span.add_bytes(ingest.size)
     except Exception as e:
-      logger.error(f"Logging failed: {e}")
+      logger.error(f"Uploading {audio_file} failed: {e}")
       raise e
+    audio_meta = ingest.metadata()
+
+  logger.debug("Uploaded file successfully.")
+  audio_meta.update({
+    'audio_url': f"https://{episodes_bucket_name}.s3.amazonaws.com/episodes/{s3_obj_name}",
+    's3_obj_name': s3_obj_name,
+    'size': str(audio_meta['size'])
+  })
+  if title:
+    audio_meta['title'] = title
+  return audio_meta
 
 def rss_update_for_new_episode(audio_meta):
   '''Retrieves rss feed and uses metadata of new audio to generate rss data
      Pushes updated rss feed to s3
-     Returns: Length of Episodes in RSS Feed
+     Returns: pubDate, Length of Episodes in RSS Feed and title of the new episode
   '''
+  new_items, num_episodes = rss_update_for_new_episodes([audio_meta])
 
-  # download rss file from s3
-  s3.meta.client.download_file(episodes_bucket_name, rss_remote_file_name, rss_local_file_name)
+  # return num_episodes and pubDate which will be used in get_itunes_podcast_info()
+  # and the title which is used to check the new episode has been published
+  return new_items[0]['pubDate'], num_episodes, new_items[0]['title']
 
-  # get meta and use its params in rss_feed.xml
-  audio_url = audio_meta['audio_url']
-  audio_meta_key = audio_meta['s3_obj_name']
-  audio_duration = audio_meta['duration']
-  audio_size = audio_meta['size']
 
-  # Add 20 mins to current time
+def rss_update_for_new_episodes(audio_metas):
+  '''Appends an item for each audio (in order) to the rss feed in a single
+     read and write of the feed. Titles and descriptions are taken from the
+     audio metadata when it has them, and asked for otherwise.
+     Returns: list of dicts with the pubDate and title of each new item, and
+     the number of episodes in the updated feed
+  '''
+
+  # read rss feed from s3
+  with metrics.span('rss_fetch') as span:
+    rss_feed = get_storage().get_bytes(episodes_bucket_name, rss_remote_file_name)
+    span.add_bytes(len(rss_feed))
+
+  # Add 20 mins to current time, later episodes of a batch are a minute apart to keep their order
   date = datetime.now(tz=eastern)
   date = date + timedelta(minutes=20)
   fmt = '%a, %d %b %Y %H:%M:%S %Z'
-  pubDate = date.astimezone(eastern).strftime(fmt)
-
-  # parse file, ask for new values, create new item, append to xml
-  tree = ET.parse(rss_local_file_name)
-  root = tree.getroot()
-  channel_element = root[0]
-  new_episode_element = copy.deepcopy(channel_element[len(root[0])-1]) # make a copy of most recent episode
-  for idx, child in enumerate(new_episode_element):
-    if idx == 1 or idx == 5:
-      child.text = audio_url
-    elif idx == 2:
-      child.text = pubDate
-    elif idx == 4:
-      child.set("length", audio_size)
-      child.set("url",audio_url )
-    elif idx == 6:
-      child.text = audio_duration
-    elif idx == 7:
-      child.text = new_episode_element[3].text
-    elif idx < 7:
-      child.text = input(f"Enter new: {child.tag}, e.g. {child.text}\n")
-
-  channel_element.append(new_episode_element)
-  episodes_list = [child for child in root[0] if child.tag == 'item']
-  num_episodes = len(episodes_list)
-  tree.write(rss_local_file_name)
-
-
-  # push parsed file to s3 with public-read permissions
-  with open(rss_local_file_name, "rb") as f:
-    s3_client.upload_fileobj(f, episodes_bucket_name, rss_remote_file_name, ExtraArgs={'ACL': 'public-read'})
-
-  # delete file from local
-  if os.path.exists(rss_local_file_name):
-    os.remove(rss_local_file_name)
-  
-  # return num_episodes and pubDate which will be used in get_itunes_podcast_info()
-  return pubDate, num_episodes
+
+  # copy the most recent episode, ask for new values and splice it in at the end of the feed
+  last_item = feed.last_item(rss_feed)
+  new_items = []
+  for idx, audio_meta in enumerate(audio_metas):
+    # get meta and use its params in rss_feed.xml
+    audio_url = audio_meta['audio_url']
+    audio_duration = audio_meta['duration']
+    audio_size = audio_meta['size']
+    pubDate = (date + timedelta(minutes=idx)).astimezone(eastern).strftime(fmt)
+
+    # a rerun after a failed upload of the feeds finds its items already spliced in
+    existing_item = feed.find_item(rss_feed, audio_url)
+    if existing_item:
+      logger.info(f"{audio_url} is already in the rss feed, not adding it again")
+      new_items.append({'pubDate': feed.get_text(existing_item, 'pubDate'), 'title': feed.get_text(existing_item, 'title')})
+      continue
+
+    title = audio_meta.get('title') or input(f"Enter new: title, e.g. {feed.get_text(last_item, 'title')}\n")
+    description = audio_meta.get('description') or \
+      input(f"Enter new: description, e.g. {feed.get_text(last_item, 'description')}\n")
+    new_item = last_item
+    for tag, text in (('title', title), ('link', audio_url), ('pubDate', pubDate), ('description', description), \
+      ('guid', audio_url), ('duration', audio_duration), ('summary', description)):
+      new_item = feed.set_text(new_item, tag, text)
+    new_item = feed.set_attributes(new_item, 'enclosure', {'length': audio_size, 'url': audio_url})
+
+    rss_feed = feed.append_item(rss_feed, new_item)
+    new_items.append({'pubDate': pubDate, 'title': title})
+  num_episodes = feed.count_items(rss_feed)
+
+  # push the updated full feed and the recent episodes feed to s3 with public-read permissions
+  put_feed(rss_feed)
+  return new_items, num_episodes
+
+
+def put_feed(rss_feed):
+  '''Uploads the full feed and the recent episodes feed built from it'''
+  objects = feed_variants.feed_objects(rss_feed, rss_remote_file_name, recent_episodes=rss_recent_episodes, \
+    cache_control=rss_cache_control, recent_rss_key=rss_recent_remote_file_name)
+  with metrics.span('rss_publish') as span:
+    for key, (body, extra_args) in objects.items():
+      get_storage().put_bytes(episodes_bucket_name, key, body, **extra_args)
+      span.add_bytes(len(body))
+      logger.info(f"Uploaded {key}: {len(body)} bytes")
+
+
+def get_spotify_episode_sync():
+  '''Returns a SpotifyEpisodeSync backed by the local Spotify episode cache'''
+  sp = clients.get('spotify')
+  here = os.path.dirname(os.path.realpath(__file__))
+  cache_path = os.path.join(here, config['DEFAULT'].get('SPOTIFY_CACHE_FILEPATH', fallback='spotify_episodes_cache.json'))
+  return SpotifyEpisodeSync(sp, cache_path, show_id=config['DEFAULT'].get('SPOTIFY_SHOW_ID'))
 
 
 def get_spotify_info():
@@ -146,29 +321,7 @@ def get_spotify_info():
   all of which can be used to create the snippet
   about the episode.
   '''
-  os.environ["SPOTIPY_CLIENT_ID"] = config['DEFAULT']['SPOTIPY_CLIENT_ID']
-  os.environ["SPOTIPY_CLIENT_SECRET"] = config['DEFAULT']['SPOTIPY_CLIENT_SECRET']
-  os.environ["SPOTIPY_REDIRECT_URI"] = config['DEFAULT']['SPOTIPY_REDIRECT_URI']
-  client_credentials_manager = SpotifyClientCredentials()
-  sp = spotipy.Spotify(client_credentials_manager=client_credentials_manager)
-  search_str = "fourth official soccer podcast"
-  media_type = "episode"
-  results_limit = 20
-  results_offset = 0
-  market = "US"
-  result = sp.search(search_str, results_limit, results_offset, media_type, market)
-  episodes_list = result['episodes']['items']
-  while result['episodes']['items']:
-    results_offset = results_offset+results_limit
-    try:
-        logger.info(f"At {results_offset} in Spotify podcast list, getting next {results_limit} podcasts.")
-        result = sp.search(search_str, results_limit, results_offset, media_type, market)
-        episodes_list.extend(result['episodes']['items'])
-    except Exception as e:
-        logger.error(f"No more Spotify podcast items found: {e}")
-
-  episodes_list  = sorted(episodes_list, key=itemgetter('release_date'), reverse=True)
-  last_episode = episodes_list[0]
+  last_episode = get_spotify_episode_sync().latest_episode()
   return {
       'name': last_episode['name'],
       'description': last_episode['description'],
@@ -177,23 +330,27 @@ def get_spotify_info():
   }
 
 
+def get_google_podcast_episodes():
+  '''Returns every podcast episode of the Google account. gmusicapi makes its
+  requests with a session of its own, so the call and the size of the listing
+  are added to the metrics here.
+  '''
+  episodes_list = clients.get('google').get_all_podcast_episodes(config['DEFAULT']['DEVICE_ID'])
+  metrics.add_api_calls()
+  metrics.add_bytes(len(json.dumps(episodes_list)))
+  return episodes_list
+
+
 def get_google_music_info():
   '''Returns podcast information of the current episode from Google
   Podcasts. The name of the episode, the release date and the description of the episode;
   all of which can be used to create the about the episode.
   '''
 
-  here = os.path.dirname(os.path.realpath(__file__))
-  oauth_path = os.path.join(here, config['DEFAULT']['OAUTH_FILEPATH'])
-  device_id = config['DEFAULT']['DEVICE_ID']
-  mc = Mobileclient()
   series_title = "Fourth Official Soccer Podcast"
   google_music_url = "https://play.google.com/music/m/"
-  
-  # mc.perform_oauth() only needed once (can be avoided by providing an oauth file)  
-  mc.oauth_login(device_id, oauth_path)
     
-  episodes_list = mc.get_all_podcast_episodes(device_id)  
+  episodes_list = get_google_podcast_episodes()
   episodes_list = [episode for episode in episodes_list if episode['seriesTitle'] == series_title]
   episodes_list  = sorted(episodes_list, key=itemgetter('publicationTimestampMillis'), reverse=True)
   last_episode = episodes_list[0]
@@ -210,22 +367,15 @@ def get_google_music_info():
 
 def get_itunes_podcast_info(num_episodes_in_rss):
   '''Uses the podcast ID to retrieve information about the iTunes Podcast URL
-  Uses BeautifulSoup4 for parsing
+  The json embedded in the podcast page is extracted and decoded once
   '''
   url = config['DEFAULT']['APPLE_PODCAST_URL']
-  response = requests.get(url)
-  soup = BeautifulSoup(response.text, "html.parser")
-  info_script_id = "shoebox-ember-data-store"
-  info_script_type = "fastboot/shoebox"
-  episode_type = "media/podcast-episode"
-
-  def matches_id_and_type(tag):
-    return tag.has_attr('id') and tag.has_attr('type') and tag['id'] == info_script_id and tag['type'] == info_script_type
-
-  info_script = soup.findAll(matches_id_and_type)
-  itunes_episodes_count = json.loads(info_script[0].contents[0])["data"]["attributes"]["trackCount"]
-  episodes_list = [episode for episode in json.loads(info_script[0].contents[0])["included"] if \
-    episode['type'] == episode_type]
+  response = http_session.get(url)
+  response.raise_for_status()
+  shoebox_data = get_shoebox_data(response.text)
+  podcast_attributes = shoebox_data["data"]["attributes"]
+  itunes_episodes_count = podcast_attributes["trackCount"]
+  episodes_list = [episode for episode in shoebox_data["included"] if episode['type'] == EPISODE_TYPE]
   episodes_list  = sorted(episodes_list, key=itemgetter('id'), reverse=True)
   latest_episode = episodes_list[0]
 
@@ -238,7 +388,7 @@ def get_itunes_podcast_info(num_episodes_in_rss):
   if num_episodes_in_rss == itunes_episodes_count:
     episode_url = latest_episode['attributes']['url']
   else:
-    episode_url = json.loads(info_script[0].contents[0])["data"]["attributes"]["url"]
+    episode_url = podcast_attributes["url"]
     updated = False
 
   return {
@@ -253,17 +403,10 @@ def get_all_podcasts_from_google_music():
   '''Returns sorted list of all podcast episodes from Google as a list
   '''
 
-  here = os.path.dirname(os.path.realpath(__file__))
-  oauth_path = os.path.join(here, config['DEFAULT']['OAUTH_FILEPATH'])
-  device_id = config['DEFAULT']['DEVICE_ID']
-  mc = Mobileclient()
   series_title = "Fourth Official Soccer Podcast"
   google_music_url = "https://play.google.com/music/m/"
 
-  # mc.perform_oauth() only needed once (can be avoided by providing an oauth file)
-  mc.oauth_login(device_id, oauth_path)
-
-  episodes_list = mc.get_all_podcast_episodes(device_id)
+  episodes_list = get_google_podcast_episodes()
   episodes_list = [episode for episode in episodes_list if episode['seriesTitle'] == series_title]
   episodes_list  = sorted(episodes_list, key=itemgetter('publicationTimestampMillis'))
   url_list = [f"{google_music_url}{episode['episodeId']}?t={episode['title']}-{episode['seriesTitle']}" for episode in episodes_list]
@@ -275,9 +418,27 @@ def get_all_podcasts_from_google_music():
   return episodes_list
 
 def get_all_podcasts_from_itunes():
+  '''Returns sorted list of all podcast episodes from Apple, fetched over HTTP.
+  Falls back to clicking through the podcast page in a browser when Apple
+  returns fewer episodes than it lists and APPLE_SELENIUM_FALLBACK is set.
+  '''
+  episodes_list, itunes_episodes_count = get_all_apple_episodes(config['DEFAULT']['APPLE_PODCAST_URL'])
+  if len(episodes_list) < itunes_episodes_count:
+    print(f"Only found {len(episodes_list)} of {itunes_episodes_count} Apple episodes over HTTP")
+    if apple_selenium_fallback:
+      return get_all_podcasts_from_itunes_with_selenium()
+  episodes_list  = sorted(episodes_list, key=itemgetter('name'))
+  return episodes_list
+
+def get_all_podcasts_from_itunes_with_selenium():
   '''Uses the podcast ID to retrieve information about the iTunes Podcast URL
-  Uses BeautifulSoup4 for parsing
+  Uses Selenium to load every episode and BeautifulSoup4 for parsing
   '''
+  # selenium is only needed for this fallback, so it is an optional dependency
+  from selenium import webdriver
+  from selenium.webdriver.firefox.options import Options
+  from bs4 import BeautifulSoup
+
   options = Options()
   options.headless = True
   driver = webdriver.Firefox(options=options)
@@ -306,43 +467,88 @@ def get_all_podcasts_from_itunes():
   return episodes_list
 
 
-def get_all_podcasts_from_spotify():
+def get_all_podcasts_from_spotify(full_refresh=False):
   '''Returns all podcasts from spotify.
+  full_refresh re-reads every episode instead of only the new ones, so edited
+  and removed episodes are updated in the local cache too.
   '''
-
-  client_credentials_manager = SpotifyClientCredentials()
-  sp = spotipy.Spotify(client_credentials_manager=client_credentials_manager)
-  search_str = "fourth official soccer podcast"
-  media_type = "episode"
-  results_limit = 20
-  results_offset = 0
-  market = "US"
-  result = sp.search(search_str, results_limit, results_offset, media_type, market)
-  episodes_list = result['episodes']['items']
-  while result['episodes']['items']:
-    results_offset = results_offset+results_limit
-    try:
-        logger.info(f"At {results_offset} in Spotify podcast list, getting next {results_limit} podcasts.")
-        result = sp.search(search_str, results_limit, results_offset, media_type, market)
-        episodes_list.extend(result['episodes']['items'])
-    except Exception as e:
-        logger.error(f"No more Spotify podcast items found: {e}")
-
-  episodes_list  = sorted(episodes_list, key=itemgetter('release_date'))
+  spotify_sync = get_spotify_episode_sync()
+  if full_refresh:
+    spotify_sync.sync(full_refresh=True)
+  episodes_list = spotify_sync.all_episodes()
   episodes_list = [{'name': episode['name'], 'description': episode['description'], \
     'release_date': episode['release_date'], 'url': episode['external_urls']['spotify'] \
     } for episode in episodes_list]
   return episodes_list
 
+def get_all_podcasts_from_rss():
+  '''Returns all episodes in the rss feed, in feed order
+  '''
+
+  rss_feed = get_storage().get_bytes(episodes_bucket_name, rss_remote_file_name)
+  items = feed.iter_items(io.BytesIO(rss_feed), ('title', 'description', 'link', 'pubDate'))
+  episodes_list = [{'name': item['title'], 'description': item['description'], \
+    'url': item['link'], 'release_date': item['pubDate']} for item in items]
+  return episodes_list
+
+
+def get_catalog():
+  '''Returns the local episode catalog'''
+  here = os.path.dirname(os.path.realpath(__file__))
+  return EpisodeCatalog(os.path.join(here, catalog_file_name))
+
+
+def sync_catalog(catalog, force=False, full_refresh=False):
+  '''Re-fetches every source whose catalog entries are older than its ttl
+  (or every source when force is set) and stores the results in the catalog.
+  full_refresh also re-reads the whole Spotify listing instead of only its new episodes.
+  Returns: dict of source -> error for the sources that could not be fetched
+  '''
+  fetchers = {
+    'RSS': get_all_podcasts_from_rss,
+    'Google': get_all_podcasts_from_google_music,
+    'Apple': get_all_podcasts_from_itunes,
+    'Spotify': lambda: get_all_podcasts_from_spotify(full_refresh=full_refresh)
+  }
+  stale_fetchers = {source: fetcher for source, fetcher in fetchers.items() \
+    if force or catalog.is_stale(source, catalog_ttls[source])}
+  if not stale_fetchers:
+    print("Episode catalog is up to date.")
+    return {}
+
+  # stale sources are fetched concurrently, the Selenium based Apple fetch is by far the slowest
+  print(f"Syncing episode catalog from: {', '.join(stale_fetchers)}")
+  with metrics.span('catalog_sync'):
+    report = fetch_all({source: metrics.wrap('platform_fetch', fetcher, platform=source) \
+      for source, fetcher in stale_fetchers.items()}, default_timeout=bulk_fetch_timeout)
+  for source, episodes_list in report['results'].items():
+    catalog.replace_source(source, [dict(episode, release_date=episode.get('release_date', \
+      episode.get('publication_timestamp_millis'))) for episode in episodes_list])
+  for source, error in report['errors'].items():
+    print(f"Fetching episodes from {source} failed: {error}")
+  return report['errors']
+
+
+def get_episode_number(episode_name):
+  '''Returns the episode number (as a string) from a title like "Episode 12: Title Of Episode",
+  parsed the same way the catalog matches episodes across platforms
+  '''
+  episode_number = parse_episode_number(episode_name)
+  if episode_number is None:
+    raise ValueError(f"No episode number in the title: {episode_name}")
+  return str(episode_number)
+
 def get_episode_filename(spotify_episode_info):
-  episode_file_name = spotify_episode_info['name'].split(':')[0].lower().replace('.', '_').replace(' ','')
-  return f"{episode_file_name}.html"
+  '''Returns the page key of an episode, e.g. episode12.html, built from the
+  same episode number as the catalog so titles like "Episode #12: ..." get a usable url
+  '''
+  return f"episode{get_episode_number(spotify_episode_info['name'])}.html"
   
 
 
 def consolidate_episode_info(spotify_episode_info, google_music_info, apple_episode_info, release_date, twitter_status_link=None):
   episode_file_name = get_episode_filename(spotify_episode_info)
-  episode_number = spotify_episode_info['name'].split(':')[0].split(' ')[1]
+  episode_number = get_episode_number(spotify_episode_info['name'])
 
   return {
     'name': spotify_episode_info['name'],
@@ -357,226 +563,557 @@ def consolidate_episode_info(spotify_episode_info, google_music_info, apple_epis
   }
 
 
+def render_episode_html_page(podcast_info):
+  '''Renders the html page of an episode
+     Returns: the page's file name and its html as bytes
+  '''
+  # the template is only parsed once per run, each page is a plain substitution
+  template = load_episode_template(html_template_local_file_name, get_asset_map(), get_image_map(), image_sizes)
+  return podcast_info['file_name'], render_episode_page(template, podcast_info)
+
 def create_episode_html_page(podcast_info):
   '''Creates an html page that populates all information 
-    about podcast to the page and saves it in file where it can be 
-    deployed to the website
-  '''
-  new_episode_filename = podcast_info['file_name']
-  with open(html_template_local_file_name) as fp:
-    soup = BeautifulSoup(fp, "html.parser")
-    article = soup.find('article')
-    article.h1.string = podcast_info['name']  # use episode title
-    article.find_all("div", "entry-date")[0].string = podcast_info['release_date']
-    article.find_all("div", "content-header")[0].string = podcast_info['description']
-    podcasts_links_div = article.find_all("div", "podcasts-list")[0]
-    podcasts_links_div.find_all(href=re.compile("apple"))[0]["href"] = podcast_info['apple_podcast_url']
-    podcasts_links_div.find_all(href=re.compile("google"))[0]["href"] = podcast_info['google_podcast_url']
-    podcasts_links_div.find_all(href=re.compile("spotify"))[0]["href"] = podcast_info['spotify_url']
-    podcasts_links_div.find_all(href=re.compile("twitter"))[0]["href"] = podcast_info['twitter_status_url']
-
-    episode_html = soup.prettify("utf-8")
-    with open(new_episode_filename, "wb") as file:
-      file.write(episode_html)
-    
-    # push parsed episode html file to s3 with public-read permissions
-    with open(new_episode_filename, "rb") as f:
-      s3_client.upload_fileobj(f, website_bucket_name, new_episode_filename, ExtraArgs={'ACL': 'public-read', 'ContentType': 'text/html'}) 
+    about podcast to the page and deploys it to the website
+  '''
+  with metrics.span('page_render'):
+    new_episode_filename, episode_html = render_episode_html_page(podcast_info)
+
+  # push episode html to s3 with public-read permissions
+  with metrics.span('s3_publish') as span:
+    get_storage().put_bytes(website_bucket_name, new_episode_filename, episode_html, ACL='public-read', ContentType='text/html')
+    span.add_bytes(len(episode_html))
+  return new_episode_filename, episode_html
+
+def load_index_manifest():
+  '''Returns the manifest the paged website index is rendered from.
+  The first time, it is created by parsing the current index.html.
+  '''
+  storage = get_storage()
+  try:
+    manifest = index_pages.load_manifest(storage.get_bytes(website_bucket_name, index_manifest_remote_file_name))
+  except get_s3_client().exceptions.NoSuchKey:
+    print(f"No {index_manifest_remote_file_name} found, creating it from {index_html_remote_file_name}")
+    manifest = index_pages.create_manifest(storage.get_bytes(website_bucket_name, index_html_remote_file_name))
+  manifest['page_size'] = index_page_size
+  asset_map = get_asset_map()
+  if asset_map:
+    manifest['shell'] = asset_build.rewrite_template(manifest['shell'], asset_map)
+  return manifest
+
+def get_asset_map():
+  '''Returns the stylesheets and scripts bundled by the last asset build, {} before the first one'''
+  here = os.path.dirname(os.path.realpath(__file__))
+  return asset_build.load_asset_map(os.path.join(here, asset_map_file_name))
 
-  # delete episode html from local
-  if os.path.exists(new_episode_filename):
-    os.remove(new_episode_filename)
 
-def bulk_update_website_index_page(podcast_info, idx, created_pages_list_length, posts, new_article):
-  '''Updates the index_html page to include a link to the newly created
-  episode page so that it can be shown to viewers of the page.
-  New html link has to go to the top of the page.
-  '''
-  print(f"Bulk index update on episode {idx+1}")
-
-  def populate_new_article(posts, article, podcast_info, idx):
-    new_article = copy.copy(article)
-    new_article['id'] = f"post-{idx+1}"
-    new_article.find_all("a")[0].string = f"Episode {podcast_info['episode_number']}"
-    new_article.find_all("a")[0]["href"] = podcast_info['file_name']
-    new_article.find("div", "entry-date published").string = podcast_info['release_date']
-    new_article.find_all("a")[1].string = podcast_info['name']
-    new_article.find_all("a")[1]["href"] = podcast_info['file_name']
-    excerpt_a = new_article.find_all("a")[2]
-    excerpt_a["href"] = podcast_info['file_name']
-    new_article.find("div", "excerpt").string = podcast_info['description']
-    new_article.find("div", "excerpt").insert(1, excerpt_a)
-    posts.insert(0, new_article)
-    return posts, new_article
-
-  # download index.html from website-s3-bucket
-  if idx == 0:
-    s3.meta.client.download_file(website_bucket_name, index_html_remote_file_name, index_html_local_file_name)
-
-    with open(index_html_local_file_name) as fp:
-      soup = BeautifulSoup(fp, "html.parser")
-      posts = soup.find("div", "blog-holder")
-      articles = posts.find_all("article")
-      new_article = copy.copy(articles[0])
-      posts, new_article = populate_new_article(posts, new_article, podcast_info, idx)
-      return posts, new_article
-  elif idx < created_pages_list_length-1:
-    posts, new_article = populate_new_article(posts, new_article, podcast_info, idx)
-    return posts, new_article
-  else:
-    posts, new_article = populate_new_article(posts, new_article, podcast_info, idx)
-    with open(index_html_local_file_name) as fp:
-      soup = BeautifulSoup(fp, "html.parser")
-      soup.find("div", "blog-holder").replace_with(posts)
+def build_website_assets(dry_run=False):
+  '''Bundles and minifies the stylesheets and scripts the episode page template
+  links to into files named after their content, uploads them compressed with
+  immutable caching, then points the template and the index pages at them.
+  Episode pages pick up the bundles on the next bulk-index.
+  '''
+  here = os.path.dirname(os.path.realpath(__file__))
+  with open(html_template_local_file_name) as f:
+    template_html = f.read()
+  asset_map, bundles = asset_build.build_assets(os.path.join(here, website_local_dir), template_html)
+  if not bundles:
+    print(f"{html_template_local_file_name} doesn't link to any local stylesheets or scripts")
+    return
+
+  for kind, entry in asset_map.items():
+    source_bytes = sum(os.path.getsize(os.path.join(here, website_local_dir, *source.split('/'))) for source in entry['sources'])
+    print(f"{entry['bundle']}: {len(entry['sources'])} files, {source_bytes} -> {len(bundles[entry['bundle']])} bytes")
+  if dry_run:
+    return
+
+  publish_website_objects(asset_build.asset_objects(bundles, asset_cache_control))
+  asset_build.save_asset_map(os.path.join(here, asset_map_file_name), asset_map)
+
+  # only the page shell changed, so every index page is rendered from the manifest as it is
+  manifest = load_index_manifest()
+  publish_website_objects(render_index_pages(manifest, range(1, index_pages.page_count(manifest) + 1)))
+  print("Run bulk-index to rebuild the episode pages with the new bundles")
+
+
+def get_image_map():
+  '''Returns the image variants made by the last image build, {} before the first one'''
+  here = os.path.dirname(os.path.realpath(__file__))
+  return image_build.load_image_map(os.path.join(here, image_map_file_name))
 
-    with open(index_html_local_file_name, "wb") as file:
-      file.write(soup.prettify("utf-8"))
 
-    # push parsed index html file to s3 with public-read permissions
-    with open(index_html_local_file_name, "rb") as f:
-      s3_client.upload_fileobj(f, website_bucket_name, index_html_remote_file_name, ExtraArgs={'ACL': 'public-read', 'ContentType': 'text/html'})
-    return posts, new_article
+def build_website_images(dry_run=False):
+  '''Makes resized, recompressed and WebP variants of the website's png and jpg
+  images (reusing the ones cached from earlier builds), uploads them with
+  immutable caching and rewrites the <img> tags of the index pages into
+  <picture>s offering them. Episode pages pick them up on the next bulk-index.
+  '''
+  here = os.path.dirname(os.path.realpath(__file__))
+  site_dir = os.path.join(here, website_local_dir)
+  cache = image_build.ImageCache(os.path.join(here, image_cache_dir), image_widths, image_quality)
+  images = image_build.find_images(site_dir, image_dirs)
+  image_map, files = image_build.build_images(site_dir, images, cache)
+
+  source_bytes = sum(os.path.getsize(os.path.join(site_dir, *image.split('/'))) for image in images)
+  full_width_bytes = sum(min(os.path.getsize(files[variant['key']]) for variant in entry['variants'] \
+    if variant['width'] == entry['width']) for entry in image_map.values())
+  print(f"{len(images)} images ({cache.built} built, {cache.reused} cached): {source_bytes} bytes, " \
+    f"{full_width_bytes} bytes at full width, {len(files)} variants")
+  if dry_run:
+    return
+
+  publish_website_objects(image_build.image_objects(files, asset_cache_control))
+  image_build.save_image_map(os.path.join(here, image_map_file_name), image_map)
+
+  manifest = load_index_manifest()
+  publish_website_objects(render_index_pages(manifest, range(1, index_pages.page_count(manifest) + 1)))
+  print("Run bulk-index to rebuild the episode pages with the new images")
+
+
+def render_index_pages(manifest, page_numbers):
+  '''Renders the given pages of the website index along with the manifest
+     Returns: dict of s3 key -> (body, put_object args) ready for publish_website_objects()
+  '''
+  with metrics.span('index_render'):
+    pages = index_pages.render_pages(manifest, page_numbers, index_html_remote_file_name)
+    image_map = get_image_map()
+    if image_map:
+      pages = {key: image_build.rewrite_images(page_html.decode('utf-8'), image_map, image_sizes).encode('utf-8') \
+        for key, page_html in pages.items()}
+  objects = {key: (page_html, {'ACL': 'public-read', 'ContentType': 'text/html'}) for key, page_html in pages.items()}
+  objects[index_manifest_remote_file_name] = (index_pages.dump_manifest(manifest), {'ContentType': 'application/json'})
+  return objects
+
+def publish_website_objects(objects):
+  '''Uploads the objects that changed to the website bucket, several at a time'''
+  manifest_path = None
+  if publish_manifest_file_name:
+    here = os.path.dirname(os.path.realpath(__file__))
+    manifest_path = os.path.join(here, publish_manifest_file_name)
+  with metrics.span('s3_publish') as span:
+    report = publish_objects(get_s3_client(), website_bucket_name, objects, manifest_path=manifest_path, \
+      max_workers=publish_max_workers)
+    span.add_bytes(report['bytes_uploaded'])
+  print(f"Published website: {report['uploaded']} uploaded, {report['skipped']} unchanged, " \
+    f"{report['bytes_saved']} bytes saved")
+  if report['failed']:
+    raise RuntimeError(f"Failed to upload: {', '.join(report['failed'])}")
+  return report
+
+def bulk_update_website_index_page(episode_meta_list, full=False):
+  '''Rebuilds the pages of the website index so that they link to every
+  episode page in episode_meta_list, newest episode at the top of index.html.
+  Only the pages whose articles changed are rendered, unless full is set.
+  Returns: dict of s3 key -> (body, put_object args) of the rendered index pages
+  '''
+  manifest = load_index_manifest()
+  article_fragments = index_pages.render_articles(manifest, episode_meta_list)
+  if full:
+    page_numbers = index_pages.set_articles(manifest, reversed(article_fragments))
+  else:
+    page_numbers = index_pages.replace_articles(manifest, reversed(article_fragments))
+  print(f"Index pages rebuilt: {len(page_numbers)} of {index_pages.page_count(manifest)}")
+  return render_index_pages(manifest, page_numbers)
 
 def update_website_index_page(podcast_info):
   '''Updates the index_html page to include a link to the newly created
   episode page so that it can be shown to viewers of the page.
-  New html link has to go to the top of the page.
+  New html link has to go to the top of the page, older links shift down
+  onto the following pages.
   '''
-  
-  # download index.html from website-s3-bucket
-  s3.meta.client.download_file(website_bucket_name, index_html_remote_file_name, index_html_local_file_name)
-
-  with open(index_html_local_file_name) as fp:
-    soup = BeautifulSoup(fp, "html.parser")
-    posts = soup.find("div", "blog-holder")
-    articles = posts.find_all("article")
-    new_article = copy.copy(articles[0])
-    new_article['id'] = f"post-{str(len(articles)+1)}"
-    new_article.find_all("a")[0].string = f"Episode {podcast_info['episode_number']}"
-    new_article.find_all("a")[0]["href"] = podcast_info['file_name']
-    new_article.find("div", "entry-date published").string = podcast_info['release_date']
-    new_article.find_all("a")[1].string = podcast_info['name']
-    new_article.find_all("a")[1]["href"] = podcast_info['file_name']
-    excerpt_a = new_article.find_all("a")[2]
-    excerpt_a["href"] = podcast_info['file_name']
-    new_article.find("div", "excerpt").string = podcast_info['description']
-    new_article.find("div", "excerpt").insert(1, excerpt_a)
-    posts.insert(0, new_article)
-
-    with open(index_html_local_file_name, "wb") as file:
-      file.write(soup.prettify("utf-8"))
-    
-    # push parsed index html file to s3 with public-read permissions
-    with open(index_html_local_file_name, "rb") as f:
-      s3_client.upload_fileobj(f, website_bucket_name, index_html_remote_file_name, ExtraArgs={'ACL': 'public-read', 'ContentType': 'text/html'})
-
-
-def bulk_index_update():
-  '''Does a bulk update of index.html by adding all podcasts to the page
-  '''
-  def get_all_release_dates():
-    '''Get all release dates as a list
-    '''
-
-    # download rss file from s3
-    s3.meta.client.download_file(episodes_bucket_name, rss_remote_file_name, rss_local_file_name)
-    release_date_list = []
-    tree = ET.parse(rss_local_file_name)
-    root = tree.getroot()
-    channel_element = root[0]
-    for item in channel_element.findall('item'):
-      for idx, child in enumerate(item):
-        if idx == 2:
-          release_date_list.append(child.text)
-    return release_date_list
-
-  release_date_list = get_all_release_dates()
-  google_episodes = get_all_podcasts_from_google_music()
-  itunes_episodes = get_all_podcasts_from_itunes()
-  spotify_episodes = get_all_podcasts_from_spotify()
-  created_pages_list = []
-
-  if len(google_episodes) == len(itunes_episodes) and len(google_episodes) == len(spotify_episodes):
-    print(f"Proceed. All episodes list have matching lengths of {len(google_episodes)}")
-    episode_meta_list = [consolidate_episode_info(spotify_episode_info, google_music_info, apple_episode_info, release_date) \
-      for spotify_episode_info, google_music_info, apple_episode_info, release_date in zip(spotify_episodes, \
-        google_episodes, itunes_episodes, release_date_list)]
-    for idx, episode_meta in enumerate(episode_meta_list):
-      create_episode_html_page(episode_meta)
-      created_pages_list.append(idx)
-    print(f"Number of episode pages created: {len(created_pages_list)}")
-
-    posts = []
-    new_article = None
-    for created_page, idx in enumerate(created_pages_list):
-      posts, new_article = bulk_update_website_index_page(episode_meta_list[idx], idx, len(created_pages_list), posts, new_article)
-  else:
-    print(f"Don't proceed, episode list lengths do not match")
+  publish_website_objects(index_objects_for_new_episodes([podcast_info]))
+
+
+def index_objects_for_new_episodes(podcast_infos):
+  '''Adds the articles of new episodes (oldest first) to the top of the index.
+  Returns: dict of s3 key -> (body, put_object args) of the index pages that changed
+  '''
+  manifest = load_index_manifest()
+  page_numbers = []
+  for podcast_info in podcast_infos:
+    new_article = index_pages.render_article(manifest, podcast_info, len(manifest['articles'])+1)
+    page_numbers = index_pages.add_article(manifest, new_article)
+  return render_index_pages(manifest, page_numbers)
+
+
+def consolidate_catalog_episode(episode_sources):
+  '''Builds the page info of an episode from whichever sources list it.
+  Links to platforms that don't list the episode are left empty.
+  '''
+  primary = reconcile.primary_episode(episode_sources)
 
+  def source_url(source):
+    return episode_sources[source]['url'] if source in episode_sources else None
 
-def post_episode_update_to_twitter(apple_episode_info, google_music_info, spotify_episode_info, episode_file_name):
+  spotify_episode_info = dict(primary, url=source_url('Spotify'), description=primary['description'] or '')
+  release_date = episode_sources.get('RSS', primary)['release_date']
+  return consolidate_episode_info(spotify_episode_info, {'url': source_url('Google')}, {'url': source_url('Apple')}, \
+    release_date)
+
+
+def bulk_index_update(offline=False, full=False):
+  '''Does a bulk update of index.html by adding all podcasts to the page.
+  Episodes are read from the local catalog, which is only synced with the
+  platforms for stale sources (or not at all when offline is set).
+  Episodes are joined on their episode number; ones missing from a source are
+  reported and still published. Only pages whose content changed since the
+  last run are rebuilt, unless full is set.
+  '''
+  catalog = get_catalog()
+  try:
+    if not offline:
+      errors = sync_catalog(catalog)
+      if errors:
+        print(f"Could not fetch episodes from: {', '.join(errors)}, using their last synced episodes")
+    catalog_episodes = catalog.episodes()
+    missing = reconcile.missing_sources(catalog_episodes, catalog_ttls)
+    print(f"{len(catalog_episodes) - len(missing)} of {len(catalog_episodes)} episodes are listed by every source")
+    for line in reconcile.format_missing(missing):
+      print(line)
+
+    episode_meta_list = [consolidate_catalog_episode(episode_sources) for episode_sources in catalog_episodes.values()]
+    # pages are rebuilt when the template, the asset bundles or the image variants it links to change
+    asset_map = get_asset_map()
+    image_map = get_image_map()
+    template_hash = reconcile.file_hash(html_template_local_file_name)
+    if asset_map or image_map:
+      template_hash += reconcile.content_hash({'assets': asset_map, 'images': image_map})
+    page_hashes = {episode_meta['file_name']: reconcile.content_hash(episode_meta, template_hash) \
+      for episode_meta in episode_meta_list}
+    changed_pages = set(reconcile.changed_keys(page_hashes, {} if full else catalog.content_hashes()))
+
+    website_objects = {}
+    with metrics.span('page_render'):
+      template = load_episode_template(html_template_local_file_name, asset_map, image_map, image_sizes)
+      for episode_meta in episode_meta_list:
+        if episode_meta['file_name'] in changed_pages:
+          website_objects[episode_meta['file_name']] = (render_episode_page(template, episode_meta), \
+            {'ACL': 'public-read', 'ContentType': 'text/html'})
+    print(f"Episode pages rebuilt: {len(website_objects)} of {len(episode_meta_list)}")
+    website_objects.update(bulk_update_website_index_page(episode_meta_list, full=full))
+
+    # everything is uploaded in one go, and only if it changed
+    publish_website_objects(website_objects)
+    catalog.set_content_hashes(page_hashes)
+  finally:
+    catalog.close()
+
+
+@lru_cache(maxsize=None)
+def get_url_shortener():
+  '''Returns the URL shortener, with its cache of previously shortened URLs'''
+  from twitter_utils.shorten_urls import PROVIDERS, ShortenURL, URLCache
+
+  here = os.path.dirname(os.path.realpath(__file__))
+  cache = URLCache(os.path.join(here, shortener_cache_file_name), max_entries=shortener_cache_max_entries)
+  return ShortenURL(provider=PROVIDERS[shortener_provider](), cache=cache, session=http_session.get_session())
+
+
+def post_episode_update_to_twitter(apple_episode_info, google_music_info, spotify_episode_info, episode_file_name, status=None):
   '''Using URLS of respective podcast platforms, post new episode updates
   Args:
       urls:   list representing urls from podcast platforms. length = 3
   Returns:  
       Twitter status instance representing posted status.
   '''
-  status = input(f"Enter Podcast Twitter Status update:\n")
+  if status is None:
+    status = input(f"Enter Podcast Twitter Status update:\n")
   fourth_official_url = f"https://{website_bucket_name}/{episode_file_name}"
   nl = '\n'
   urls = f"Apple: {apple_episode_info['url']}{nl}Google:{google_music_info['url']}{nl}Spotify: {spotify_episode_info['url']}{nl}Website: {fourth_official_url}"
   status = f"{status}{nl}{urls}"
 
-  twitter_consumer_key = config['DEFAULT']['TWITTER_CONSUMER_KEY']
-  twitter_consumer_secret = config['DEFAULT']['TWITTER_CONSUMER_SECRET']
-  twitter_access_token_key = config['DEFAULT']['TWITTER_ACCESS_TOKEN_KEY']
-  twitter_access_token_secret = config['DEFAULT']['TWITTER_ACCESS_TOKEN_SECRET']
-  api = twitter.Api(twitter_consumer_key, twitter_consumer_secret, 
-    twitter_access_token_key, twitter_access_token_secret)
+  api = clients.get('twitter')
 
   def post_status_with_shortened_url(status, api):
     
-    shortener = ShortenURL()
+    shortener = get_url_shortener()
 
     # Find all URLs contained within the status message. Value of ``urls`` will
     # be a list.
     URL_REGEXP = r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\(\), ]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'''
     urls = re.findall(URL_REGEXP, status)
+    with metrics.span('url_shortening'):
+      short_urls = shortener.ShortenMany(urls)
 
     for url in urls:
-      status = status.replace(url, shortener.Shorten(url), 1)
+      status = status.replace(url, short_urls[url], 1)
 
-    return api.PostUpdates(status, continuation="\u2026")
+    with metrics.span('tweet') as span:
+      statuses = api.PostUpdates(status, continuation="\u2026")
+      span.add_api_calls(len(statuses))
+    return statuses
 
   return post_status_with_shortened_url(status, api)
 
 
+def is_same_episode(episode_name, episode_title):
+  '''Compares the "Episode 12" part of a platform's episode name with the new episode title'''
+  return episode_name.split(':')[0].strip().lower() == episode_title.split(':')[0].strip().lower()
+
+
+def wait_for_episode_publication(episode_title, num_episodes_in_rss):
+  '''Polls Spotify, Apple and Google independently until each of them lists the new
+  episode or publish_deadline passes, whichever comes first.
+  Returns: dict of platform name -> latest episode info from that platform
+  '''
+  def check_spotify():
+    info = get_spotify_info()
+    return is_same_episode(info['name'], episode_title), info
+
+  def check_apple():
+    info = get_itunes_podcast_info(num_episodes_in_rss)
+    return info['podcast_updated'], info
+
+  def check_google():
+    info = get_google_music_info()
+    return is_same_episode(info['name'], episode_title), info
+
+  checks = {'Spotify': check_spotify, 'Apple': check_apple, 'Google': check_google}
+  checks = {platform: metrics.wrap('platform_fetch', check, platform=platform) for platform, check in checks.items()}
+  with metrics.span('wait_for_publication'):
+    status = wait_for_publication(checks, publish_deadline, initial_delay=publish_poll_initial_delay,
+      max_delay=publish_poll_max_delay, check_timeout=platform_fetch_timeout)
+
+  episode_infos = {}
+  for platform, platform_status in status.items():
+    if not platform_status['published']:
+      print(f"{platform} did not publish the new episode within {publish_deadline} secs, using its latest info.")
+    if platform_status['info'] is None:
+      # every check failed, one last try lets the error surface
+      platform_status['info'] = checks[platform]()[1]
+    episode_infos[platform] = platform_status['info']
+  return episode_infos
+
+
+def get_publish_journal(audio_file):
+  '''Returns the journal of the publication of audio_file'''
+  here = os.path.dirname(os.path.realpath(__file__))
+  return PublishJournal(os.path.join(here, publish_journal_file_name), journal.audio_key(audio_file))
+
+
 def socialize_podcast():
   '''All the magic happens here. A newly created podcast is uploaded to S3.
   All the major podcasting platform publish the podcast, then a html page
   is created for the podcast with links to all platforms and it gets added to the website.
+  Every stage is journaled, so rerunning with the same audio after a failure
+  resumes from the first stage that did not complete.
   '''
   twitter_handle = config['DEFAULT']['TWITTER_HANDLE']
-  
-  audio_meta = push_new_episode_audio()
-  release_date, num_episodes_in_rss = rss_update_for_new_episode(audio_meta)
 
-  print(f"Sleeping for {wait_time} secs to allow episode to publish - manually refresh Apple feed immediately")
-  time.sleep(wait_time)
-  
-  spotify_episode_info = get_spotify_info()
-  apple_episode_info = get_itunes_podcast_info(num_episodes_in_rss)
-  google_music_info = get_google_music_info()
+  audio_file = prompt_audio_file()
+  publish_journal = get_publish_journal(audio_file)
+  if publish_journal.completed:
+    print(f"{audio_file} has already been published, delete {publish_journal_file_name} to publish it again.")
+    return
+  if publish_journal.completed_stages:
+    print(f"Resuming the publication of {audio_file}, reusing: {', '.join(publish_journal.completed_stages)}")
+
+  audio_meta = publish_journal.run('audio_upload', push_new_episode_audio, audio_file)
+
+  def update_rss():
+    release_date, num_episodes_in_rss, episode_title = rss_update_for_new_episode(audio_meta)
+    return {'pubDate': release_date, 'num_episodes': num_episodes_in_rss, 'title': episode_title}
+  rss_update = publish_journal.run('rss_update', update_rss)
+  release_date, episode_title = rss_update['pubDate'], rss_update['title']
+
+  if not publish_journal.done('publication'):
+    print(f"Waiting up to {publish_deadline} secs for the episode to publish - manually refresh Apple feed immediately")
+  episode_infos = publish_journal.run('publication', wait_for_episode_publication, episode_title, rss_update['num_episodes'])
+  spotify_episode_info = episode_infos['Spotify']
+  apple_episode_info = episode_infos['Apple']
+  google_music_info = episode_infos['Google']
   episode_file_name = get_episode_filename(spotify_episode_info)
 
   # post episode update to twitter
-  tweet_data = post_episode_update_to_twitter(apple_episode_info, \
-    google_music_info, spotify_episode_info, episode_file_name)
-  twitter_status_link = f"https://twitter.com/{twitter_handle}/status/{tweet_data[0].id}"
+  def tweet():
+    tweet_data = post_episode_update_to_twitter(apple_episode_info, \
+      google_music_info, spotify_episode_info, episode_file_name)
+    return {'tweet_id': tweet_data[0].id}
+  tweet_id = publish_journal.run('tweet', tweet)['tweet_id']
+  twitter_status_link = f"https://twitter.com/{twitter_handle}/status/{tweet_id}"
 
   episode_meta = consolidate_episode_info(spotify_episode_info, \
     google_music_info, apple_episode_info, release_date, twitter_status_link)
+
+  def publish_page():
+    page_file_name, page_html = create_episode_html_page(episode_meta)
+    return {'file_name': page_file_name, 'html': page_html.decode('utf-8')}
+  publish_journal.run('episode_page', publish_page)
+
+  def update_index():
+    update_website_index_page(episode_meta)
+    return {'file_name': episode_meta['file_name']}
+  publish_journal.run('index_update', update_index)
+
+  # keep the catalog current without waiting for the next sync
+  catalog = get_catalog()
+  for source, episode_info in episode_infos.items():
+    catalog.upsert_episode(source, episode_info)
+  catalog.upsert_episode('RSS', {'name': episode_title, 'url': audio_meta['audio_url'], 'release_date': release_date})
+  catalog.close()
+  publish_journal.complete()
+
+
+def load_batch_manifest(manifest_path):
+  '''Reads a batch manifest: a json list (or {"episodes": [...]}) of episodes,
+  oldest first, each with the audio "path", "title" and "description" and
+  optionally the "tweet" to post about it.
+  '''
+  with open(manifest_path) as f:
+    batch = json.load(f)
+  if isinstance(batch, dict):
+    batch = batch['episodes']
+  for episode in batch:
+    missing_fields = [field for field in ('path', 'title', 'description') if not episode.get(field)]
+    if missing_fields:
+      raise ValueError(f"Batch episode {episode} is missing: {', '.join(missing_fields)}")
+    if parse_episode_number(episode['title']) is None:
+      raise ValueError(f"Batch episode title has no episode number: {episode['title']}")
+    if not os.path.exists(episode['path']):
+      raise ValueError(f"Batch episode audio not found: {episode['path']}")
+  return batch
+
+
+def socialize_podcast_batch(manifest_path):
+  '''Publishes several episodes in one run: the audio is uploaded concurrently,
+  the rss feed is updated once with all of them, publication is waited for
+  once, and the episode pages and index are published together.
+  '''
+  batch = load_batch_manifest(manifest_path)
+  twitter_handle = config['DEFAULT']['TWITTER_HANDLE']
+  print(f"Publishing {len(batch)} episodes from {manifest_path}")
+
+  with ThreadPoolExecutor(max_workers=batch_upload_workers) as executor:
+    audio_metas = list(executor.map(lambda episode: upload_episode_audio(episode['path'], episode['title']), batch))
+  for audio_meta, episode in zip(audio_metas, batch):
+    audio_meta.update(title=episode['title'], description=episode['description'])
+  new_items, num_episodes_in_rss = rss_update_for_new_episodes(audio_metas)
+
+  # platforms list episodes in feed order, so the batch is out once its last episode is
+  print(f"Waiting up to {publish_deadline} secs for the episodes to publish - manually refresh Apple feed immediately")
+  wait_for_episode_publication(new_items[-1]['title'], num_episodes_in_rss)
+
+  # the info of every new episode comes from one fresh sync of all sources
+  catalog = get_catalog()
+  try:
+    sync_catalog(catalog, force=True)
+    catalog_episodes = catalog.episodes()
+  finally:
+    catalog.close()
+
+  episode_metas = []
+  website_objects = {}
+  for episode, new_item in zip(batch, new_items):
+    episode_number = parse_episode_number(episode['title'])
+    episode_sources = catalog_episodes.get(episode_number) or \
+      {'RSS': {'name': episode['title'], 'description': episode['description'], 'url': None, 'release_date': new_item['pubDate']}}
+    for line in reconcile.format_missing(reconcile.missing_sources({episode_number: episode_sources}, catalog_ttls)):
+      print(line)
+    episode_meta = consolidate_catalog_episode(episode_sources)
+
+    if episode.get('tweet'):
+      platform_info = {platform: {'url': episode_meta[key] or ''} for platform, key in \
+        (('Apple', 'apple_podcast_url'), ('Google', 'google_podcast_url'), ('Spotify', 'spotify_url'))}
+      tweet_data = post_episode_update_to_twitter(platform_info['Apple'], platform_info['Google'], \
+        platform_info['Spotify'], episode_meta['file_name'], status=episode['tweet'])
+      episode_meta['twitter_status_url'] = f"https://twitter.com/{twitter_handle}/status/{tweet_data[0].id}"
+
+    with metrics.span('page_render'):
+      episode_file_name, episode_html = render_episode_html_page(episode_meta)
+    website_objects[episode_file_name] = (episode_html, {'ACL': 'public-read', 'ContentType': 'text/html'})
+    episode_metas.append(episode_meta)
+
+  website_objects.update(index_objects_for_new_episodes(episode_metas))
+  publish_website_objects(website_objects)
+  print(f"Published {len(episode_metas)} episodes")
+
+
+def rebuild_episode_page(episode_number, offline=False):
+  '''Re-creates the html page of a single episode from the catalog'''
+  catalog = get_catalog()
+  if not offline:
+    sync_catalog(catalog)
+  sources = catalog.episodes().get(episode_number, {})
+  catalog.close()
+
+  if not sources:
+    print(f"Can't rebuild episode {episode_number}, no source lists it")
+    return
+  missing = reconcile.missing_sources({episode_number: sources}, catalog_ttls)
+  for line in reconcile.format_missing(missing):
+    print(line)
+  episode_meta = consolidate_catalog_episode(sources)
   create_episode_html_page(episode_meta)
-  update_website_index_page(episode_meta)
+  print(f"Rebuilt {episode_meta['file_name']}")
+
 
-socialize_podcast()
+def write_metrics():
+  '''Writes the stage metrics of this run to the json report and the Prometheus textfile'''
+  here = os.path.dirname(os.path.realpath(__file__))
+  if metrics_report_file_name:
+    metrics.write_json(os.path.join(here, metrics_report_file_name))
+  if metrics_prometheus_file_name:
+    metrics.write_prometheus(os.path.join(here, metrics_prometheus_file_name))
+  for stage in metrics.stage_totals():
+    labels = ' '.join(stage['labels'].values())
+    logger.info(f"{stage['name']} {labels}: {stage['wall_time']:.2f}s over {stage['count']} runs, " \
+      f"{stage['bytes']} bytes, {stage['api_calls']} API calls")
+
+
+def main(argv=None):
+  '''Command line entry point. Running without a subcommand publishes a new episode.'''
+  parser = argparse.ArgumentParser(description="Fourth Official Soccer Podcast workflow")
+  subparsers = parser.add_subparsers(dest='command')
+  subparsers.add_parser('publish', help="upload a new episode, tweet it and add it to the website")
+  bulk_index_parser = subparsers.add_parser('bulk-index', help="regenerate every episode page and index.html")
+  bulk_index_parser.add_argument('--offline', action='store_true', help="only use the local episode catalog")
+  bulk_index_parser.add_argument('--full', action='store_true', help="rebuild every page, even unchanged ones")
+  publish_batch_parser = subparsers.add_parser('publish-batch', help="publish several episodes listed in a json manifest")
+  publish_batch_parser.add_argument('manifest', help="json list of episodes with path, title, description and optional tweet")
+  rebuild_page_parser = subparsers.add_parser('rebuild-page', help="regenerate the page of a single episode")
+  rebuild_page_parser.add_argument('episode_number', type=int)
+  rebuild_page_parser.add_argument('--offline', action='store_true', help="only use the local episode catalog")
+  build_assets_parser = subparsers.add_parser('build-assets', help="bundle, minify and upload the website's stylesheets and scripts")
+  build_assets_parser.add_argument('--dry-run', action='store_true', help="only report the bundles, upload nothing")
+  build_images_parser = subparsers.add_parser('build-images', help="make and upload resized and WebP variants of the website's images")
+  build_images_parser.add_argument('--dry-run', action='store_true', help="only build the variants, upload nothing")
+  sync_catalog_parser = subparsers.add_parser('sync-catalog', help="refresh the local episode catalog")
+  sync_catalog_parser.add_argument('--force', action='store_true', help="re-fetch sources that are still fresh, and every Spotify episode")
+  args = parser.parse_args(argv)
+
+  startup_time = time.perf_counter() - _module_load_started
+  logger.debug(f"Started in {startup_time * 1000:.0f}ms")
+  if startup_time > startup_budget:
+    logger.warning(f"Startup took {startup_time:.2f}s, over the {startup_budget}s budget")
+
+  missing_keys = [key for key in required_config_keys if not config['DEFAULT'].get(key)]
+  if missing_keys:
+    print(f"config.ini is missing: {', '.join(missing_keys)}")
+    return 1
+
+  metrics.run_name = args.command or 'publish'
+  try:
+    if args.command == 'bulk-index':
+      bulk_index_update(offline=args.offline, full=args.full)
+    elif args.command == 'publish-batch':
+      socialize_podcast_batch(args.manifest)
+    elif args.command == 'rebuild-page':
+      rebuild_episode_page(args.episode_number, offline=args.offline)
+    elif args.command == 'build-assets':
+      build_website_assets(dry_run=args.dry_run)
+    elif args.command == 'build-images':
+      build_website_images(dry_run=args.dry_run)
+    elif args.command == 'sync-catalog':
+      catalog = get_catalog()
+      errors = sync_catalog(catalog, force=args.force, full_refresh=args.force)
+      catalog.close()
+      return 1 if errors else 0
+    else:
+      socialize_podcast()
+    return 0
+  finally:
+    write_metrics()
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,218 @@
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+
+from html_utils.templates import CompiledTemplate
+from html_utils.templates import SLOT_MARKER
+
+DEFAULT_PREFIX = "assets/"
+DEFAULT_NAME = "site"
+DEFAULT_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+HASH_LENGTH = 10
+CONTENT_TYPES = {'css': 'text/css; charset=utf-8', 'js': 'application/javascript; charset=utf-8'}
+
+COMMENT_REGEXP = re.compile(r'<!--.*?-->', re.S)
+LINK_REGEXP = re.compile(r'<link\b[^>]*>', re.I)
+SCRIPT_REGEXP = re.compile(r'<script\b[^>]*\bsrc\s*=[^>]*>\s*</script>', re.I)
+ATTRIBUTE_REGEXP = r'\b{0}\s*=\s*["\']([^"\']*)["\']'
+CSS_URL_REGEXP = re.compile(r'url\(\s*(["\']?)([^"\')]+)\1\s*\)')
+
+
+def _attribute(tag, name):
+  match = re.search(ATTRIBUTE_REGEXP.format(name), tag, re.I)
+  return match.group(1) if match else None
+
+
+def _is_local(ref):
+  return bool(ref) and not re.match(r'^([a-z]+:|//|#)', ref, re.I)
+
+
+def normalize_ref(ref):
+  '''Returns the site relative path of a local reference, without query or fragment'''
+  ref = re.split(r'[?#]', ref, 1)[0]
+  return posixpath.normpath(ref.lstrip('/')) if ref else ref
+
+
+def _tags(html):
+  '''Yields (kind, match) for the stylesheet links and external scripts of html
+  that are not inside comments (e.g. IE conditional comments), in order.
+  '''
+  comments = [match.span() for match in COMMENT_REGEXP.finditer(html)]
+  matches = [('css', match) for match in LINK_REGEXP.finditer(html) \
+    if (_attribute(match.group(0), 'rel') or '').lower() == 'stylesheet'] + \
+    [('js', match) for match in SCRIPT_REGEXP.finditer(html)]
+  for kind, match in sorted(matches, key=lambda kind_match: kind_match[1].start()):
+    if not any(start <= match.start() < end for start, end in comments):
+      yield kind, match
+
+
+def _tag_ref(kind, tag):
+  return _attribute(tag, 'href' if kind == 'css' else 'src')
+
+
+def find_references(html):
+  '''Returns dict of kind (css or js) -> the local files html links to, in order'''
+  references = {'css': [], 'js': []}
+  for kind, match in _tags(html):
+    ref = _tag_ref(kind, match.group(0))
+    if _is_local(ref) and normalize_ref(ref) not in references[kind]:
+      references[kind].append(normalize_ref(ref))
+  return references
+
+
+def minify_css(css):
+  from rcssmin import cssmin
+
+  return cssmin(css)
+
+
+def minify_js(js):
+  from rjsmin import jsmin
+
+  return jsmin(js)
+
+
+def rebase_urls(css, source_path, bundle_path):
+  '''Rewrites the relative url()s of the css in source_path so that they
+  resolve the same from bundle_path (both relative to the site root)
+  '''
+  source_dir = posixpath.dirname(source_path)
+  bundle_dir = posixpath.dirname(bundle_path) or '.'
+
+  def rebase(match):
+    quote, url = match.groups()
+    if not _is_local(url) or url.startswith('data:'):
+      return match.group(0)
+    path, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+    rebased = posixpath.relpath(posixpath.normpath(posixpath.join(source_dir, path)), bundle_dir)
+    return f"url({quote}{rebased}{suffix}{quote})"
+  return CSS_URL_REGEXP.sub(rebase, css)
+
+
+def content_hash(body):
+  return hashlib.sha256(body).hexdigest()[:HASH_LENGTH]
+
+
+def build_bundle(site_dir, kind, sources, prefix=DEFAULT_PREFIX, name=DEFAULT_NAME):
+  '''Concatenates and minifies the sources of a kind into one file named after its content.
+  Returns: the bundle's key (relative to the site root) and its content as bytes
+  '''
+  parts = []
+  for source in sources:
+    with open(os.path.join(site_dir, *source.split('/')), encoding='utf-8') as f:
+      parts.append((source, f.read()))
+
+  if kind == 'css':
+    # every bundle lands in the same folder, so rebasing doesn't depend on the hash
+    placeholder = f"{prefix}{name}.css"
+    body = minify_css('\n'.join(rebase_urls(text, source, placeholder) for source, text in parts))
+  else:
+    # a missing semicolon at the end of one file must not join it to the next one
+    body = '\n;\n'.join(minify_js(text) for _, text in parts)
+  body = body.encode('utf-8')
+  return f"{prefix}{name}.{content_hash(body)}.{kind}", body
+
+
+def build_assets(site_dir, html, prefix=DEFAULT_PREFIX, name=DEFAULT_NAME):
+  '''Bundles the local stylesheets and scripts html links to.
+  Returns: the asset map (kind -> {'sources': [...], 'bundle': key}) and dict of bundle key -> content
+  '''
+  asset_map = {}
+  bundles = {}
+  for kind, sources in find_references(html).items():
+    if sources:
+      key, body = build_bundle(site_dir, kind, sources, prefix, name)
+      asset_map[kind] = {'sources': sources, 'bundle': key}
+      bundles[key] = body
+  return asset_map, bundles
+
+
+def gzip_bytes(body):
+  # mtime=0 keeps the output (and its md5) the same for the same content
+  return gzip.compress(body, compresslevel=9, mtime=0)
+
+
+def asset_objects(bundles, cache_control=DEFAULT_CACHE_CONTROL):
+  '''Returns the objects to publish for the bundles, as publish_objects() takes them.
+  Bundles are stored gzip compressed, which every browser accepts (s3 can't pick
+  an encoding per request). Their names change with their content, so they can
+  be cached forever.
+  '''
+  objects = {}
+  for key, body in bundles.items():
+    args = {'ACL': 'public-read', 'ContentType': CONTENT_TYPES[key.rpartition('.')[2]], 'CacheControl': cache_control}
+    objects[key] = (gzip_bytes(body), dict(args, ContentEncoding='gzip'))
+  return objects
+
+
+def _bundled(ref, entry):
+  '''True when ref is one of the bundle's sources, or a bundle of any hash built from them'''
+  ref = normalize_ref(ref)
+  stem, _, extension = entry['bundle'].rpartition('.')
+  stem = stem[:-HASH_LENGTH]
+  return ref in entry['sources'] or re.fullmatch(re.escape(stem) + r'[0-9a-f]+\.' + re.escape(extension), ref)
+
+
+def _bundle_tag(kind, key):
+  if kind == 'css':
+    return f'<link href="{key}" rel="stylesheet" type="text/css"/>'
+  return f'<script src="{key}" type="text/javascript"></script>'
+
+
+def rewrite_html(html, asset_map):
+  '''Replaces the links to the bundled files with one link to each bundle, where
+  the first of them was. Links to an older bundle are replaced too.
+  '''
+  replaced = set()
+  pieces = []
+  position = 0
+  for kind, match in _tags(html):
+    entry = asset_map.get(kind)
+    if not entry or not _bundled(_tag_ref(kind, match.group(0)), entry):
+      continue
+    if kind not in replaced:
+      pieces.append(html[position:match.start()])
+      pieces.append(_bundle_tag(kind, entry['bundle']))
+      replaced.add(kind)
+    else:
+      # the indentation of a removed link goes with it
+      pieces.append(re.sub(r'\n[ \t]*$', '', html[position:match.start()]))
+    position = match.end()
+  pieces.append(html[position:])
+  return ''.join(pieces)
+
+
+def rewrite_template(template, asset_map):
+  '''Like rewrite_html, for a CompiledTemplate (or its dict form)'''
+  as_dict = isinstance(template, dict)
+  compiled = CompiledTemplate.from_dict(template) if as_dict else template
+  names = [SLOT_MARKER.format(name) for name, _ in compiled.slots]
+  # the segments are rewritten together, so a link is only kept once across them
+  text = rewrite_html(''.join(segment + (names[idx] if idx < len(names) else '') \
+    for idx, segment in enumerate(compiled.segments)), asset_map)
+  segments = []
+  for marker in names:
+    segment, _, text = text.partition(marker)
+    segments.append(segment)
+  segments.append(text)
+  rewritten = CompiledTemplate(segments, compiled.slots)
+  return rewritten.to_dict() if as_dict else rewritten
+
+
+def load_asset_map(path):
+  '''Returns the asset map of the last build, or {} before the first one'''
+  try:
+    with open(path) as f:
+      return json.load(f)
+  except (OSError, ValueError):
+    return {}
+
+
+def save_asset_map(path, asset_map):
+  tmp_path = f"{path}.tmp"
+  with open(tmp_path, "w") as f:
+    json.dump(asset_map, f, indent=1, sort_keys=True)
+  os.replace(tmp_path, path)
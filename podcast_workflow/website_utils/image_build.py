@@ -0,0 +1,232 @@
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+
+from website_utils.asset_build import DEFAULT_CACHE_CONTROL
+from website_utils.asset_build import normalize_ref
+
+DEFAULT_WIDTHS = (160, 320, 640, 1280)
+DEFAULT_QUALITY = 82
+DEFAULT_PREFIX = "optimized/"
+DEFAULT_SIZES = "100vw"
+HASH_LENGTH = 10
+CACHE_VERSION = 2 # bump when build_variants changes what it makes, so cached variants are rebuilt
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+CONTENT_TYPES = {'jpg': 'image/jpeg', 'png': 'image/png', 'webp': 'image/webp'}
+
+IMG_REGEXP = re.compile(r'<img\b[^>]*>', re.I)
+PICTURE_REGEXP = re.compile(r'<picture\b.*?</picture>', re.I | re.S)
+ATTRIBUTE_REGEXP = r'\b{0}\s*=\s*["\']([^"\']*)["\']'
+
+
+def file_hash(path):
+  sha256 = hashlib.sha256()
+  with open(path, "rb") as f:
+    for block in iter(lambda: f.read(1024 * 1024), b''):
+      sha256.update(block)
+  return sha256.hexdigest()[:HASH_LENGTH]
+
+
+def find_images(site_dir, image_dirs):
+  '''Returns the site relative paths of the png and jpg images in image_dirs, sorted'''
+  images = []
+  for image_dir in image_dirs:
+    for dir_path, _, file_names in os.walk(os.path.join(site_dir, image_dir)):
+      for file_name in file_names:
+        if os.path.splitext(file_name)[1].lower() in IMAGE_EXTENSIONS:
+          images.append(os.path.relpath(os.path.join(dir_path, file_name), site_dir).replace(os.sep, '/'))
+  return sorted(images)
+
+
+def _save(image, path, image_format, quality):
+  if image_format == 'jpg':
+    image.convert('RGB').save(path, 'JPEG', quality=quality, optimize=True, progressive=True)
+  elif image_format == 'png':
+    image.save(path, 'PNG', optimize=True)
+  else:
+    image.save(path, 'WEBP', quality=quality)
+
+
+def build_variants(source_path, out_dir, widths=DEFAULT_WIDTHS, quality=DEFAULT_QUALITY):
+  '''Writes recompressed and WebP copies of an image to out_dir, at each of
+  widths narrower than the image and at its own width. No variant is allowed
+  to be bigger than the image: recompressed copies that aren't smaller are
+  left out, except at full width where the image itself is used. WebP copies
+  are only kept when every one of them is smaller than the copy it stands in for.
+  Returns: the image's width and height and the list of variants written
+  ({'file', 'width', 'format'}), smallest first
+  '''
+  from PIL import Image
+
+  image_format = 'png' if source_path.lower().endswith('.png') else 'jpg'
+  with Image.open(source_path) as image:
+    image.load()
+  width, height = image.size
+  if image.mode not in ('RGB', 'RGBA'):
+    image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+  source_size = os.path.getsize(source_path)
+  variants = []
+  webp_variants = []
+  for variant_width in sorted({w for w in widths if w < width} | {width}):
+    resized = image if variant_width == width else \
+      image.resize((variant_width, max(1, round(height * variant_width / width))), Image.LANCZOS)
+
+    file_name = f"{variant_width}w.{image_format}"
+    path = os.path.join(out_dir, file_name)
+    _save(resized, path, image_format, quality)
+    if os.path.getsize(path) >= source_size:
+      if variant_width == width:
+        shutil.copyfile(source_path, path)
+      else:
+        os.remove(path)
+    if os.path.exists(path):
+      variants.append({'file': file_name, 'width': variant_width, 'format': image_format})
+    # a browser picks the WebP of the width it would otherwise fetch, or the image itself when there is none
+    fallback_size = os.path.getsize(path) if os.path.exists(path) else source_size
+
+    webp_file_name = f"{variant_width}w.webp"
+    webp_path = os.path.join(out_dir, webp_file_name)
+    _save(resized, webp_path, 'webp', quality)
+    webp_variants.append(({'file': webp_file_name, 'width': variant_width, 'format': 'webp'},
+      os.path.getsize(webp_path) < fallback_size))
+
+  if all(smaller for _, smaller in webp_variants):
+    variants.extend(variant for variant, _ in webp_variants)
+  else:
+    for variant, _ in webp_variants:
+      os.remove(os.path.join(out_dir, variant['file']))
+  return {'width': width, 'height': height, 'variants': sorted(variants, key=lambda variant: variant['width'])}
+
+
+class ImageCache(object):
+  '''Keeps the variants of every image in a folder named after the hash of
+  the image (and the build settings), so repeat builds only process the
+  images that changed.
+  '''
+
+  def __init__(self, cache_dir, widths=DEFAULT_WIDTHS, quality=DEFAULT_QUALITY):
+    self.cache_dir = cache_dir
+    self.widths = tuple(sorted(widths))
+    self.quality = quality
+    self.built = 0
+    self.reused = 0
+
+  def _entry_dir(self, source_hash):
+    settings = hashlib.sha256(json.dumps([CACHE_VERSION, self.widths, self.quality]).encode('utf-8')).hexdigest()[:8]
+    return os.path.join(self.cache_dir, f"{source_hash}-{settings}")
+
+  def variants(self, source_path, source_hash):
+    '''Returns the image info of build_variants() with the folder holding the variants as 'dir' '''
+    entry_dir = self._entry_dir(source_hash)
+    info_path = os.path.join(entry_dir, "variants.json")
+    try:
+      with open(info_path) as f:
+        info = json.load(f)
+      self.reused += 1
+    except (OSError, ValueError):
+      os.makedirs(entry_dir, exist_ok=True)
+      info = build_variants(source_path, entry_dir, self.widths, self.quality)
+      # variants.json is written last, so an interrupted build is redone
+      tmp_path = f"{info_path}.tmp"
+      with open(tmp_path, "w") as f:
+        json.dump(info, f, indent=1)
+      os.replace(tmp_path, info_path)
+      self.built += 1
+    return dict(info, dir=entry_dir)
+
+
+def build_images(site_dir, images, cache, prefix=DEFAULT_PREFIX):
+  '''Builds (or reuses from cache) the variants of images, paths relative to site_dir.
+  Variant keys carry the hash of their source image, so they can be cached forever.
+  Returns: the image map (image path -> {'width', 'height', 'variants': [{'key', 'width', 'format'}]})
+  and dict of variant key -> local file of the variant
+  '''
+  image_map = {}
+  files = {}
+  for image in images:
+    source_path = os.path.join(site_dir, *image.split('/'))
+    source_hash = file_hash(source_path)
+    info = cache.variants(source_path, source_hash)
+    stem = posixpath.splitext(image)[0]
+    variants = []
+    for variant in info['variants']:
+      key = f"{prefix}{stem}.{source_hash}.{variant['file']}"
+      files[key] = os.path.join(info['dir'], variant['file'])
+      variants.append({'key': key, 'width': variant['width'], 'format': variant['format']})
+    image_map[image] = {'width': info['width'], 'height': info['height'], 'variants': variants}
+  return image_map, files
+
+
+def image_objects(files, cache_control=DEFAULT_CACHE_CONTROL):
+  '''Returns the objects to publish for the variant files, as publish_objects() takes them'''
+  objects = {}
+  for key, path in files.items():
+    with open(path, "rb") as f:
+      body = f.read()
+    objects[key] = (body, {'ACL': 'public-read', 'ContentType': CONTENT_TYPES[key.rpartition('.')[2]],
+      'CacheControl': cache_control})
+  return objects
+
+
+def _attribute(tag, name):
+  match = re.search(ATTRIBUTE_REGEXP.format(name), tag, re.I)
+  return match.group(1) if match else None
+
+
+def _srcset(variants):
+  return ', '.join(f"{variant['key']} {variant['width']}w" for variant in variants)
+
+
+def _picture(tag, entry, default_sizes):
+  '''Wraps an <img> in a <picture> offering the WebP variants, with the
+  recompressed variants as its srcset and the full width one as its src.
+  Without WebP variants it stays a plain <img>.
+  '''
+  fallback = [variant for variant in entry['variants'] if variant['format'] != 'webp']
+  webp = [variant for variant in entry['variants'] if variant['format'] == 'webp']
+  width = _attribute(tag, 'width')
+  sizes = f"{width}px" if width and width.isdigit() else default_sizes
+
+  attributes = re.sub(r'\s(src|srcset|sizes)\s*=\s*("[^"]*"|\'[^\']*\')', '', tag[len('<img'):].rstrip('/>').rstrip())
+  img = f'<img src="{fallback[-1]["key"]}" srcset="{_srcset(fallback)}" sizes="{sizes}"{attributes}/>'
+  if not webp:
+    return img
+  return f'<picture><source type="image/webp" srcset="{_srcset(webp)}" sizes="{sizes}"/>{img}</picture>'
+
+
+def rewrite_images(html, image_map, default_sizes=DEFAULT_SIZES):
+  '''Replaces every <img> of an image in image_map with a <picture> offering its
+  variants. Images already inside a <picture> are left alone, so rewriting twice
+  changes nothing.
+  '''
+  pictures = [match.span() for match in PICTURE_REGEXP.finditer(html)]
+
+  def rewrite(match):
+    if any(start <= match.start() < end for start, end in pictures):
+      return match.group(0)
+    src = _attribute(match.group(0), 'src')
+    entry = image_map.get(normalize_ref(src)) if src else None
+    if not entry:
+      return match.group(0)
+    return _picture(match.group(0), entry, default_sizes)
+  return IMG_REGEXP.sub(rewrite, html)
+
+
+def load_image_map(path):
+  '''Returns the image map of the last build, or {} before the first one'''
+  try:
+    with open(path) as f:
+      return json.load(f)
+  except (OSError, ValueError):
+    return {}
+
+
+def save_image_map(path, image_map):
+  tmp_path = f"{path}.tmp"
+  with open(tmp_path, "w") as f:
+    json.dump(image_map, f, indent=1, sort_keys=True)
+  os.replace(tmp_path, path)